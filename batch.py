@@ -0,0 +1,342 @@
+import argparse
+import random
+import sys
+import time
+from game import Game, MODES, SURVIVAL, HARDCORE, LEFT, RIGHT, DOWN, ROTATE, DROP, STEP_TIME
+from player import Player
+from shapes import ROTATIONS, COLOR_CODES
+
+# NumPy is optional for the game, only this module needs it
+try:
+    import numpy as np
+except ImportError as e:
+    raise ImportError('the batch engine needs NumPy, install it with: pip install numpy') from e
+
+NO_ACTION = -1
+# chance of a random key press per tick in verify and bench
+ACTIONS_PER_TICK = 0.1
+
+# dx, dy and rotation of the actions below DROP, a move into an invalid place is undone
+MOVES = np.zeros((DROP, 3), dtype=np.int64)
+MOVES[LEFT], MOVES[RIGHT], MOVES[DOWN], MOVES[ROTATE] = (-1, 0, 0), (1, 0, 0), (0, 1, 0), (0, 0, 1)
+
+# (dx, dy) of every cell indexed by [shape, rotation, cell]; shapes with fewer than four
+# rotations are padded by repeating theirs so the table is rectangular
+ROTATION_COUNTS = np.array([len(rotations) for rotations in ROTATIONS])
+OFFSETS = np.array([[rotations[r % len(rotations)] for r in range(4)] for rotations in ROTATIONS])
+
+
+# many games advanced in lockstep, one tick for all of them per call; the rules are the
+# ones of game.Game, but every board lives in one (N, height, width) array and every
+# step works on all boards at once. A cell holds 0 when empty, otherwise the shape index
+# plus one. Boards that lost stay as they are.
+class BatchGame(object):
+    def __init__(self, seeds, mode=SURVIVAL, speed_level=30, width=10, height=20):
+        n = len(seeds)
+        self.mode = mode
+        self.width = width
+        self.height = height
+        self.boards = np.zeros((n, height, width), dtype=np.uint8)
+        # shapes come from one random.Random per board, like Game, so a board matches the game with its seed
+        self.rngs = [random.Random(seed) for seed in seeds]
+        self.index = np.array([rng.randrange(len(ROTATIONS)) for rng in self.rngs])
+        self.next_index = np.array([rng.randrange(len(ROTATIONS)) for rng in self.rngs])
+        self.rotation = np.zeros(n, dtype=np.int64)
+        self.x = np.full(n, width // 2, dtype=np.int64)
+        self.y = np.zeros(n, dtype=np.int64)
+        self.change_piece = np.zeros(n, dtype=bool)
+        self.lost = np.zeros(n, dtype=bool)
+
+        # timers and player stats, see Game.tick and Player
+        self.ticks = np.zeros(n, dtype=np.int64)
+        self.fall_time = np.zeros(n)
+        self.time_elapsed = np.zeros(n, dtype=np.int64)
+        self.hardcore_time = np.zeros(n, dtype=np.int64)
+        self.timer = np.zeros(n, dtype=np.int64)
+        self.fall_speed = np.full(n, 0.45 - speed_level * 0.005)
+        self.speed_level = np.full(n, speed_level, dtype=np.int64)
+        self.extra_speed = np.zeros(n, dtype=np.int64)
+        self.combo = np.zeros(n, dtype=np.int64)
+        self.max_combo = np.zeros(n, dtype=np.int64)
+        self.score = np.zeros(n, dtype=np.int64)
+        self.lines = np.zeros(n, dtype=np.int64)
+        self.pieces = np.zeros(n, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.rngs)
+
+    def cells(self, index, rotation, x, y):
+        offsets = OFFSETS[index, rotation]
+        return x[:, None] + offsets[..., 0], y[:, None] + offsets[..., 1]
+
+    def valid(self, boards, index, rotation, x, y):
+        # the same test as validation.valid_placement for the given boards
+        cx, cy = self.cells(index, rotation, x, y)
+        inside = (cx >= 0) & (cx < self.width) & (cy < self.height)
+        # the modulo only keeps the lookup in range, cells outside the box are decided by inside
+        taken = self.boards[boards[:, None], cy % self.height, cx % self.width] != 0
+        # cells above the box are free as long as they are inside the walls
+        return (inside & ~(taken & (cy >= 0))).all(axis=1)
+
+    def move(self, boards, dx, dy, rotate):
+        index = self.index[boards]
+        rotation = (self.rotation[boards] + rotate) % ROTATION_COUNTS[index]
+        x = self.x[boards] + dx
+        y = self.y[boards] + dy
+        ok = self.valid(boards, index, rotation, x, y)
+        boards = boards[ok]
+        self.rotation[boards] = rotation[ok]
+        self.x[boards] = x[ok]
+        self.y[boards] = y[ok]
+
+    def drop_distance(self, boards):
+        # a piece falls until one of its cells reaches the first brick below it in its column
+        # or the floor, so the distance is the smallest gap under its cells
+        cx, cy = self.cells(self.index[boards], self.rotation[boards], self.x[boards], self.y[boards])
+        columns = self.boards[boards[:, None], :, cx] != 0
+        below = columns & (np.arange(self.height) > cy[..., None])
+        first = np.where(below.any(axis=2), below.argmax(axis=2), self.height)
+        return (first - cy - 1).min(axis=1)
+
+    def apply_actions(self, actions):
+        # one action per board, NO_ACTION for none
+        live = ~self.lost
+        boards = np.flatnonzero(live & (actions >= 0) & (actions < DROP))
+        if boards.size:
+            dx, dy, rotate = MOVES[actions[boards]].T
+            self.move(boards, dx, dy, rotate)
+        boards = np.flatnonzero(live & (actions == DROP))
+        if boards.size:
+            self.y[boards] += self.drop_distance(boards)
+
+    def tick(self):
+        # the masks are added as 0 and 1 rather than indexed, which is cheaper on every board
+        live = ~self.lost
+        self.ticks += live
+        self.fall_time += live * STEP_TIME
+        self.time_elapsed += live * STEP_TIME
+        if self.mode == HARDCORE:
+            self.hardcore_time += live * STEP_TIME
+
+        second = live & (self.time_elapsed >= 1000)
+        self.time_elapsed -= second * 1000
+        self.timer += second
+
+        if self.mode == HARDCORE:
+            harder = live & (self.hardcore_time >= 5000)
+            self.hardcore_time[harder] -= 5000
+            faster = harder & (self.fall_speed > 0.1)
+            self.fall_speed[faster] -= 0.005
+            self.speed_level[faster] += 1
+
+        falling = live & (self.fall_time >= self.fall_speed * 1000)
+        self.fall_time[falling] -= self.fall_speed[falling] * 1000
+        self.fall(np.flatnonzero(falling))
+        self.step(np.flatnonzero(live & self.change_piece))
+
+    def fall(self, boards):
+        if not boards.size:
+            return
+        self.y[boards] += 1
+        ok = self.valid(boards, self.index[boards], self.rotation[boards], self.x[boards], self.y[boards])
+        landed = boards[~ok & (self.y[boards] > 0)]
+        self.y[landed] -= 1
+        self.change_piece[landed] = True
+
+    def step(self, boards):
+        if not boards.size:
+            return
+        # lock the pieces, cells above the box end the game
+        index = self.index[boards]
+        cx, cy = self.cells(index, self.rotation[boards], self.x[boards], self.y[boards])
+        overflow = (cy < 0).any(axis=1)
+        inside = cy >= 0
+        rows = np.broadcast_to(boards[:, None], cx.shape)
+        self.boards[rows[inside], cy[inside], cx[inside]] = np.broadcast_to(index[:, None] + 1, cx.shape)[inside]
+
+        # next piece
+        self.index[boards] = self.next_index[boards]
+        self.next_index[boards] = [self.rngs[i].randrange(len(ROTATIONS)) for i in boards]
+        self.rotation[boards] = 0
+        self.x[boards] = self.width // 2
+        self.y[boards] = 0
+        self.change_piece[boards] = False
+        self.pieces[boards] += 1
+
+        # clear full rows: a stable sort puts them on top, then they are emptied
+        locked = self.boards[boards]
+        full = (locked != 0).all(axis=2)
+        cleared = full.sum(axis=1)
+        clearing = np.flatnonzero(cleared)
+        if clearing.size:
+            order = np.argsort(~full[clearing], axis=1, kind='stable')
+            compact = np.take_along_axis(locked[clearing], order[:, :, None], axis=1)
+            compact[np.arange(self.height)[None, :] < cleared[clearing, None]] = 0
+            self.boards[boards[clearing]] = compact
+
+        # the scoring of game.clear_rows and Game.step
+        scored = boards[cleared > 0]
+        count = cleared[cleared > 0]
+        self.extra_speed[scored] += count
+        self.combo[scored] += count
+        self.max_combo[scored] = np.maximum(self.max_combo[scored], self.combo[scored])
+        if self.mode == SURVIVAL:
+            faster = scored[self.fall_speed[scored] > 0.1]
+            self.fall_speed[faster] -= self.extra_speed[faster] * 0.005
+            self.speed_level[faster] += self.extra_speed[faster]
+        self.combo[boards[cleared == 0]] = 0
+        self.lines[boards] += cleared
+        self.score[boards] += cleared * (self.speed_level[boards] + self.combo[boards] * 10)
+
+        self.lost[boards] = overflow | (self.boards[boards, 0] != 0).any(axis=1)
+
+    def update(self, actions):
+        self.apply_actions(actions)
+        self.tick()
+
+    def state(self, i):
+        # what verify() compares with a scalar game
+        return {
+            'board': self.boards[i].tolist(),
+            'piece': (int(self.index[i]), int(self.rotation[i]), int(self.x[i]), int(self.y[i])),
+            'next': int(self.next_index[i]),
+            'score': int(self.score[i]),
+            'lines': int(self.lines[i]),
+            'pieces': int(self.pieces[i]),
+            'combo': int(self.combo[i]),
+            'max_combo': int(self.max_combo[i]),
+            'speed_level': int(self.speed_level[i]),
+            'fall_speed': float(self.fall_speed[i]),
+            'timer': int(self.timer[i]),
+            'lost': bool(self.lost[i]),
+        }
+
+
+def game_state(game):
+    # the scalar game in the terms of BatchGame.state
+    piece = game.current_piece
+    player = game.player
+    return {
+        'board': [[COLOR_CODES[color] if color is not None else 0 for color in row] for row in game.grid.colors],
+        'piece': (piece.index, piece.rotation % len(ROTATIONS[piece.index]), piece.x, piece.y),
+        'next': game.next_piece.index,
+        'score': player.score,
+        'lines': game.lines,
+        'pieces': game.pieces,
+        'combo': player.combo,
+        'max_combo': player.max_combo,
+        'speed_level': player.speed_level,
+        'fall_speed': player.fall_speed,
+        'timer': player.timer,
+        'lost': game.lost,
+    }
+
+
+def scalar_games(seeds, mode, speed_level, width, height):
+    games = []
+    for seed in seeds:
+        player = Player()
+        player.set_start_speed_level(speed_level)
+        games.append(Game(player, mode, random.Random(seed), width, height))
+    return games
+
+
+def random_actions(rng, n):
+    # the same random key presses for both engines
+    return np.where(rng.random(n) < ACTIONS_PER_TICK, rng.integers(0, DROP + 1, n), NO_ACTION)
+
+
+def verify(games, ticks, seed=0, mode=SURVIVAL, speed_level=30, width=10, height=20, check_every=50):
+    # runs the batch and one Game per seed side by side and compares them every few ticks;
+    # returns the first difference as (tick, board, field) or None
+    seeds = range(seed, seed + games)
+    batch = BatchGame(seeds, mode, speed_level, width, height)
+    scalar = scalar_games(seeds, mode, speed_level, width, height)
+    rng = np.random.default_rng(seed)
+    for tick in range(1, ticks + 1):
+        actions = random_actions(rng, games)
+        batch.update(actions)
+        for game, action in zip(scalar, actions.tolist()):
+            if not game.lost:
+                if action != NO_ACTION:
+                    game.apply_action(action)
+                game.tick()
+        if tick % check_every == 0 or tick == ticks:
+            for i, game in enumerate(scalar):
+                expected = game_state(game)
+                got = batch.state(i)
+                for field in expected:
+                    if expected[field] != got[field]:
+                        return tick, i, field
+        if batch.lost.all():
+            break
+    return None
+
+
+def benchmark(games, ticks, seed=0, mode=SURVIVAL, speed_level=30, width=10, height=20, scalar_games_count=None):
+    # board-ticks per second of both engines under the same random inputs
+    results = {}
+    for engine, n in (('batch', games), ('scalar', scalar_games_count or min(games, 256))):
+        seeds = range(seed, seed + n)
+        rng = np.random.default_rng(seed)
+        elapsed = 0
+        if engine == 'batch':
+            batch = BatchGame(seeds, mode, speed_level, width, height)
+            for _ in range(ticks):
+                actions = random_actions(rng, n)
+                start = time.perf_counter()
+                batch.update(actions)
+                elapsed += time.perf_counter() - start
+            board_ticks = int(batch.ticks.sum())
+        else:
+            scalar = scalar_games(seeds, mode, speed_level, width, height)
+            for _ in range(ticks):
+                actions = random_actions(rng, n).tolist()
+                start = time.perf_counter()
+                for game, action in zip(scalar, actions):
+                    if not game.lost:
+                        if action != NO_ACTION:
+                            game.apply_action(action)
+                        game.tick()
+                elapsed += time.perf_counter() - start
+            board_ticks = sum(game.ticks for game in scalar)
+        results[engine] = {'boards': n, 'board_ticks': board_ticks, 'seconds': elapsed,
+                           'board_ticks_per_second': board_ticks / elapsed if elapsed else 0}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run many games in lockstep with NumPy, check them against the '
+                                                 'scalar rules or time both.')
+    parser.add_argument('command', choices=['verify', 'bench'])
+    parser.add_argument('-n', '--games', type=int, default=1000)
+    parser.add_argument('--ticks', type=int, default=3000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--mode', choices=MODES, default='survival')
+    parser.add_argument('--speed-level', type=int, default=30)
+    parser.add_argument('--width', type=int, default=10)
+    parser.add_argument('--height', type=int, default=20)
+    parser.add_argument('--scalar-games', type=int, help='games the scalar engine runs in bench (default: up to 256)')
+    args = parser.parse_args()
+    mode = MODES[args.mode]
+
+    if args.command == 'verify':
+        start = time.perf_counter()
+        mismatch = verify(args.games, args.ticks, args.seed, mode, args.speed_level, args.width, args.height)
+        if mismatch is not None:
+            tick, board, field = mismatch
+            sys.exit(f'board {board} (seed {args.seed + board}) differs from Game in {field} at tick {tick}')
+        print(f'{args.games} games agree with Game over {args.ticks} ticks ({time.perf_counter() - start:.1f}s)')
+    else:
+        results = benchmark(args.games, args.ticks, args.seed, mode, args.speed_level, args.width, args.height,
+                            args.scalar_games)
+        for engine, result in results.items():
+            print(f'{engine:>7}: {result["boards"]:>6} boards {result["board_ticks"]:>10} board-ticks '
+                  f'{result["seconds"]:>7.2f}s {result["board_ticks_per_second"]:>12,.0f} board-ticks/s')
+        if results['scalar']['board_ticks_per_second']:
+            speedup = results['batch']['board_ticks_per_second'] / results['scalar']['board_ticks_per_second']
+            print(f'speedup: {speedup:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+# draw on an offscreen surface, no window needed
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import pygame
+from bitboard import BitBoard
+from board import Board
+from game import Game, Piece, clear_rows, convert_shape_format, DROP
+from grid import draw_grid
+from player import Player
+from shapes import SHAPES, SHAPE_COLORS
+from validation import valid_space
+
+SEED = 2021
+# number of filled rows at the bottom of the box
+FILL_LEVELS = {'empty': 0, 'low': 4, 'mid': 10, 'high': 16}
+WIDTH, HEIGHT, BLOCK_SIZE = 1100, 750, 30
+# rounds per benchmark and seconds per round, enough for sub-microsecond operations to settle
+REPEAT = 15
+MIN_TIME = 0.2
+
+
+def make_board(rng, filled_rows, full_rows=0, width=10, height=20):
+    board = BitBoard(width, height)
+    for y in range(board.height - filled_rows, board.height):
+        # leave at least one hole so the row stays, unless it is meant to be full
+        hole = rng.randrange(board.width) if y >= board.height - filled_rows + full_rows else None
+        cells = [(x, y) for x in range(board.width) if x != hole and (hole is None or rng.random() < 0.8)]
+        for x, y in cells:
+            board.lock([(x, y)], rng.choice(SHAPE_COLORS))
+    return board
+
+
+def make_pieces(rng, count):
+    pieces = []
+    for _ in range(count):
+        piece = Piece(rng.randrange(2, 8), rng.randrange(0, 6), rng.randrange(len(SHAPES)))
+        piece.rotation = rng.randrange(4)
+        pieces.append(piece)
+    return pieces
+
+
+def bench_valid_space(rng, level):
+    board = make_board(rng, FILL_LEVELS[level])
+    pieces = make_pieces(rng, 1000)
+
+    def run():
+        for piece in pieces:
+            valid_space(piece, board)
+    return run, len(pieces)
+
+
+def bench_convert_shape_format(rng, level):
+    pieces = make_pieces(rng, 1000)
+
+    def run():
+        for piece in pieces:
+            convert_shape_format(piece)
+    return run, len(pieces)
+
+
+def bench_clear_rows(rng, level):
+    filled = max(FILL_LEVELS[level], 4)
+    boards = [make_board(rng, filled, full_rows=rng.randrange(1, 5)) for _ in range(20)]
+    state = {}
+
+    def setup():
+        # fresh boards and a fresh player for every round, outside the timed part
+        state['boards'] = [board.copy() for board in boards]
+        state['player'] = Player()
+
+    def run():
+        player = state['player']
+        for board in state['boards']:
+            clear_rows(board, player)
+    return run, len(boards), setup
+
+
+def bench_hard_drop(rng, level):
+    game = Game(Player(), rng=rng)
+    game.grid = make_board(rng, FILL_LEVELS[level])
+    pieces = make_pieces(rng, 200)
+
+    def run():
+        for piece in pieces:
+            piece.y = 0
+            game.current_piece = piece
+            game.apply_action(DROP)
+    return run, len(pieces)
+
+
+def bench_draw_window(rng, level):
+    surface = pygame.display.get_surface()
+    board = Board(WIDTH, HEIGHT, BLOCK_SIZE, 10 * BLOCK_SIZE, 20 * BLOCK_SIZE)
+    grid = make_board(rng, FILL_LEVELS[level])
+    pieces = make_pieces(rng, 50)
+
+    def run():
+        # one full repaint, then the piece moving around
+        board.invalidate()
+        for piece in pieces:
+            board.draw_window(surface, grid, convert_shape_format(piece), piece.color, draw_grid)
+            # in the game draw_next_shape ends the full repaint
+            board.full_redraw = False
+    return run, len(pieces)
+
+
+def bench_draw_window_large(rng, level):
+    # 100x1000 board scrolled to the bottom, only the rows in view are compared and drawn
+    surface = pygame.display.get_surface()
+    board = Board(WIDTH, HEIGHT, 5, 100 * 5, 120 * 5)
+    grid = make_board(rng, FILL_LEVELS[level] * 50, width=100, height=1000)
+    pieces = make_pieces(rng, 50)
+    for piece in pieces:
+        # inside the middle half of the view, so the box does not scroll
+        piece.x = rng.randrange(2, 98)
+        piece.y = rng.randrange(grid.height - 85, grid.height - 35)
+    board.view_top = grid.height - board.visible_rows
+    board.draw_window(surface, grid, [], None, draw_grid)
+    board.full_redraw = False
+
+    def run():
+        for piece in pieces:
+            board.draw_window(surface, grid, convert_shape_format(piece), piece.color, draw_grid)
+    return run, len(pieces)
+
+
+def bench_draw_next_shape(rng, level):
+    surface = pygame.display.get_surface()
+    board = Board(WIDTH, HEIGHT, BLOCK_SIZE, 10 * BLOCK_SIZE, 20 * BLOCK_SIZE)
+    player = Player()
+    pieces = make_pieces(rng, 50)
+    board.draw_window(surface, BitBoard(), [], None, draw_grid)
+
+    def run():
+        for i, piece in enumerate(pieces):
+            player.timer = i // 10
+            board.draw_next_shape(piece, surface, player.score, lambda: 1000, player.format_timer,
+                                  player.speed_level, player.combo, player.max_combo)
+    return run, len(pieces)
+
+
+BENCHMARKS = {
+    'valid_space': (bench_valid_space, list(FILL_LEVELS)),
+    'convert_shape_format': (bench_convert_shape_format, ['empty']),
+    'clear_rows': (bench_clear_rows, ['low', 'high']),
+    'hard_drop': (bench_hard_drop, list(FILL_LEVELS)),
+    'draw_window': (bench_draw_window, ['empty', 'high']),
+    'draw_window_large': (bench_draw_window_large, ['high']),
+    'draw_next_shape': (bench_draw_next_shape, ['empty']),
+}
+
+
+def time_loops(run, loops, setup=None):
+    if setup is None:
+        start = time.perf_counter()
+        for _ in range(loops):
+            run()
+        return time.perf_counter() - start
+    # only run() is timed, setup() prepares the data it uses up
+    elapsed = 0
+    for _ in range(loops):
+        setup()
+        start = time.perf_counter()
+        run()
+        elapsed += time.perf_counter() - start
+    return elapsed
+
+
+def calibrate(name, level, min_time):
+    bench = BENCHMARKS[name][0]
+    # a benchmark can return a setup function as well, called untimed before every run
+    run, ops, *setup = bench(random.Random(f'{SEED}-{name}-{level}'), level)
+    setup = setup[0] if setup else None
+    # grow the loop count until one round takes min_time
+    loops = 1
+    while time_loops(run, loops, setup) < min_time:
+        loops *= 2
+    return run, ops, setup, loops
+
+
+def measure(keys, repeat, min_time):
+    # the rounds of all benchmarks take turns, so a slow spell of the machine is shared out
+    # over all of them instead of landing on whichever one happens to run at the time
+    benches = {key: calibrate(*key[:-1].split('['), min_time) for key in keys}
+    times = {key: [] for key in keys}
+    for _ in range(repeat):
+        for key, (run, ops, setup, loops) in benches.items():
+            times[key].append(time_loops(run, loops, setup) / (loops * ops))
+    return {key: {'median_ns': statistics.median(times[key]) * 1e9, 'best_ns': min(times[key]) * 1e9,
+                  'loops': benches[key][3] * benches[key][1]} for key in keys}
+
+
+def run_benchmarks(names, repeat=REPEAT, min_time=MIN_TIME):
+    pygame.display.init()
+    pygame.display.set_mode((WIDTH, HEIGHT))
+    return measure([f'{name}[{level}]' for name in names for level in BENCHMARKS[name][1]], repeat, min_time)
+
+
+def compare(results, baseline, threshold, repeat=REPEAT, min_time=MIN_TIME):
+    # the median of many rounds, one lucky or unlucky round does not move it
+    keys = sorted(key for key in results if key in baseline)
+    ratios = {key: results[key]['median_ns'] / baseline[key]['median_ns'] for key in keys}
+    slower = [key for key in keys if ratios[key] > 1 + threshold]
+    if slower:
+        # measured once more before they count, a burst of load on the machine rarely lasts that long
+        for key, result in measure(slower, repeat, min_time).items():
+            results[key] = result
+            ratios[key] = result['median_ns'] / baseline[key]['median_ns']
+    for key in keys:
+        print(f'{key:<32}{baseline[key]["median_ns"]:>12.0f}{results[key]["median_ns"]:>12.0f}{ratios[key]:>9.2f}x')
+    return [key for key in keys if ratios[key] > 1 + threshold]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the engine and rendering hot paths.')
+    parser.add_argument('names', nargs='*', help=f'benchmarks to run, any of {", ".join(BENCHMARKS)} (default: all)')
+    parser.add_argument('-o', '--output', help='write the results to this JSON file')
+    parser.add_argument('-c', '--compare', help='JSON results of an earlier run to compare against')
+    parser.add_argument('-t', '--threshold', type=float, default=0.15,
+                        help='allowed slowdown against the baseline before failing (default: 0.15)')
+    parser.add_argument('-r', '--repeat', type=int, default=REPEAT, help=f'measured rounds (default: {REPEAT})')
+    parser.add_argument('--min-time', type=float, default=MIN_TIME,
+                        help=f'seconds per measured round (default: {MIN_TIME})')
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f'unknown benchmark: {", ".join(unknown)}')
+
+    results = run_benchmarks(args.names or list(BENCHMARKS), args.repeat, args.min_time)
+    for key, result in results.items():
+        print(f'{key:<32}{result["median_ns"]:>12.0f} ns/op  (best {result["best_ns"]:.0f})')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python': platform.python_version(), 'pygame': pygame.version.ver,
+                       'machine': platform.machine(), 'seed': SEED, 'results': results}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        print(f'\n{"benchmark":<32}{"baseline":>12}{"current":>12}{"ratio":>10}')
+        regressions = compare(results, baseline, args.threshold, args.repeat, args.min_time)
+        if regressions:
+            print(f'\nslower than the baseline by more than {args.threshold:.0%}: {", ".join(regressions)}')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+# locked cells of the box: bit x of rows[y] is set when cell (x, y) is taken
+# and colors[y][x] keeps its color (None for an empty cell)
+class BitBoard(object):
+    def __init__(self, width=10, height=20):
+        self.width = width
+        self.height = height
+        self.full_row = (1 << width) - 1
+        self.rows = [0] * height
+        self.colors = [[None] * width for _ in range(height)]
+        # number of taken cells in every row, a row is full when it reaches the width
+        self.counts = [0] * height
+        # highest row with a brick in it, taken rows always form one block at the bottom
+        self.top = height
+        # highest taken row of every column, the height of the column is height - tops[x]
+        self.tops = [height] * width
+        # set when a piece locks with cells above the top row
+        self.overflow = False
+
+    def reset(self):
+        self.rows = [0] * self.height
+        self.colors = [[None] * self.width for _ in range(self.height)]
+        self.counts = [0] * self.height
+        self.top = self.height
+        self.tops = [self.height] * self.width
+        self.overflow = False
+
+    def copy(self):
+        board = BitBoard.__new__(BitBoard)
+        board.width = self.width
+        board.height = self.height
+        board.full_row = self.full_row
+        board.rows = self.rows[:]
+        board.colors = [row[:] for row in self.colors]
+        board.counts = self.counts[:]
+        board.top = self.top
+        board.tops = self.tops[:]
+        board.overflow = self.overflow
+        return board
+
+    def lock(self, positions, color):
+        for x, y in positions:
+            if y < 0:
+                self.overflow = True
+                continue
+            bit = 1 << x
+            if not self.rows[y] & bit:
+                self.counts[y] += 1
+            self.rows[y] |= bit
+            self.colors[y][x] = color
+            if y < self.top:
+                self.top = y
+            if y < self.tops[x]:
+                self.tops[x] = y
+
+    def clear_rows(self, rows=None):
+        # only the rows a piece was just locked into can have become full
+        candidates = range(self.top, self.height) if rows is None else rows
+        full = sorted(set(y for y in candidates if 0 <= y < self.height and self.counts[y] == self.width))
+        if not full:
+            return full
+
+        # walk up once from the lowest full row, moving every kept row down into
+        # the next free slot; rows above the stack are empty and never touched
+        cleared = set(full)
+        write = full[-1]
+        for read in range(full[-1], self.top - 1, -1):
+            if read in cleared:
+                continue
+            if read != write:
+                self.rows[write] = self.rows[read]
+                self.colors[write] = self.colors[read]
+                self.counts[write] = self.counts[read]
+            write -= 1
+        for i in range(write, self.top - 1, -1):
+            self.rows[i] = 0
+            self.colors[i] = [None] * self.width
+            self.counts[i] = 0
+        self.top += len(full)
+
+        # every full row lies below the top of each column, so a column top that
+        # survives moves down by exactly len(full); otherwise look further down
+        rows = self.rows
+        for x in range(self.width):
+            top = self.tops[x] + len(full)
+            while top < self.height and not (rows[top] >> x) & 1:
+                top += 1
+            self.tops[x] = top
+        return full
+
+    def set_rows(self, rows):
+        # overwrite whole rows given as {y: colors}, e.g. from a game running elsewhere,
+        # and work out the tops again
+        for y, colors in rows.items():
+            self.colors[y] = colors
+            self.rows[y] = sum(1 << x for x, color in enumerate(colors) if color is not None)
+            self.counts[y] = self.width - colors.count(None)
+        self.top = next((y for y, row in enumerate(self.rows) if row), self.height)
+        self.tops = [self.height] * self.width
+        seen = 0
+        for y in range(self.top, self.height):
+            new = self.rows[y] & ~seen
+            while new:
+                low = new & -new
+                self.tops[low.bit_length() - 1] = y
+                new ^= low
+            seen |= self.rows[y]
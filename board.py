@@ -1,13 +1,42 @@
+import os
 import pygame
+from paths import FONTS_DIR
+from shapes import ROTATIONS
+from textcache import render_text
 
-pygame.font.init()
-
-TITLE_FONT = pygame.font.Font('fonts/Maler.ttf', 65)
-SCORE_FONT = pygame.font.Font('fonts/LeagueMono-Bold.ttf', 23)
+# file and size of every font, loaded on first use so importing this module
+# does not need the font system
+FONTS = {
+    'title': ('Maler.ttf', 65),
+    'score': ('LeagueMono-Bold.ttf', 23),
+    'profiler': ('LeagueMono-Bold.ttf', 14)
+}
+LOADED_FONTS = {}
 
 BACKGROUND_COLOR = (235, 232, 231)
 FRAME_COLOR = (221, 155, 207)
 TEXT_COLOR = (122, 119, 185)
+BLOCK_COLOR = (250, 210, 204)
+
+# SIZE OF BOX, the largest one the screen has room for
+MAX_BOX_WIDTH, MAX_BOX_HEIGHT = 500, 600
+
+# the next block preview keeps its size when big boards shrink the blocks in the box
+PREVIEW_BLOCK_SIZE = 30
+
+
+def get_font(name):
+    font = LOADED_FONTS.get(name)
+    if font is None:
+        if not pygame.font.get_init():
+            pygame.font.init()
+        file, size = FONTS[name]
+        font = LOADED_FONTS[name] = pygame.font.Font(os.path.join(FONTS_DIR, file), size)
+    return font
+
+
+# static background layers by resolution, box size and theme
+BACKGROUNDS = {}
 
 
 class Board:
@@ -19,70 +48,226 @@ class Board:
         self.box_height = box_height
         self.start_x = (width - box_width) // 2
         self.start_y = (height - box_height) - 30
+        # the box shows visible_rows rows from view_top down, taller boards scroll
+        self.visible_rows = box_height // block_size
+        self.view_top = 0
+        # a thinner border for small blocks, so it does not hide the cells along the edges
+        self.border = min(5, max(1, block_size // 6))
+        self.preview_x = self.start_x + self.box_width + 50
+        # the HUD keeps the place it has next to the tallest box, so it stays on screen for short boards
+        self.preview_y = height - 30 - MAX_BOX_HEIGHT / 2 - 100
+        # what is on the surface since the last frame, used to redraw only what changed
+        self.full_redraw = True
+        self.drawn_rows = None
+        self.labels = {}
+        self.preview = None
+        self.background = None
+        self.profiler_rect = None
+
+    def invalidate(self):
+        # something else drew over the surface, repaint everything on the next frame
+        self.full_redraw = True
+
+    def cell_rect(self, x, y):
+        return pygame.Rect(self.start_x + x * self.block_size, self.start_y + y * self.block_size,
+                           self.block_size, self.block_size)
 
-    def draw_window(self, surface, grid, draw_grid):
-        surface.fill(BACKGROUND_COLOR)
+    def get_background(self, surface, grid, draw_grid):
+        # title, empty box, grid lines and preview frame never change, so they are
+        # composed once per resolution, box size and theme and blitted as one layer
+        key = (surface.get_size(), self.block_size, grid.width, grid.height, self.box_width, self.box_height,
+               BACKGROUND_COLOR, FRAME_COLOR, TEXT_COLOR, BLOCK_COLOR)
+        background = BACKGROUNDS.get(key)
+        if background is not None:
+            return background
+
+        background = pygame.Surface(surface.get_size()).convert(surface)
+        background.fill(BACKGROUND_COLOR)
 
         # draw title over the box
-        title = TITLE_FONT.render('TETRIS', True, TEXT_COLOR)
-        surface.blit(title, (self.start_x + self.box_width / 2 - (title.get_width() / 2), self.start_y / 2 - title.get_height() / 2))
+        title = render_text(get_font('title'), 'TETRIS', TEXT_COLOR)
+        background.blit(title, (self.start_x + self.box_width / 2 - (title.get_width() / 2), self.start_y / 2 - title.get_height() / 2))
 
-        # draw each brick
-        for i in range(len(grid)):
-            for j in range(len(grid[i])):
-                pygame.draw.rect(surface, grid[i][j], (self.start_x + j * self.block_size, self.start_y + i * self.block_size,
-                                                       self.block_size, self.block_size), 0)
+        # draw empty box
+        background.fill(BLOCK_COLOR, (self.start_x, self.start_y, self.box_width, self.box_height))
 
         # draw border of box
-        pygame.draw.rect(surface, FRAME_COLOR, (self.start_x, self.start_y, self.box_width, self.box_height), 5)
+        pygame.draw.rect(background, FRAME_COLOR, (self.start_x, self.start_y, self.box_width, self.box_height),
+                         self.border)
 
-        draw_grid(surface, grid, self.start_x, self.start_y, self.block_size, self.box_width, self.box_height)
+        draw_grid(background, grid, self.start_x, self.start_y, self.block_size, self.box_width, self.box_height)
 
-    def draw_next_shape(self, shape, surface, score, get_max_score, format_timer, speed_level, combo, max_combo):
         # draw preview next block
-        text = SCORE_FONT.render('Next Block', True, TEXT_COLOR)
+        text = render_text(get_font('score'), 'Next Block', TEXT_COLOR)
+        background.blit(text, (self.preview_x + 4 * PREVIEW_BLOCK_SIZE - text.get_width() / 2,
+                               self.preview_y - 80 - PREVIEW_BLOCK_SIZE))
+        self.draw_preview_borders(background)
 
-        preview_x = self.start_x + self.box_width + 50
-        preview_y = self.start_y + self.box_height / 2 - 100
-        surface.blit(text, (preview_x + 4 * self.block_size - text.get_width() / 2, preview_y - 80 - self.block_size))
-        formatted = shape.shape[shape.rotation % len(shape.shape)]
+        BACKGROUNDS[key] = background
+        return background
 
-        # draw score
-        label = SCORE_FONT.render(f'SCORE: {score}', True, TEXT_COLOR)
-        surface.blit(label, (self.start_x/2 - label.get_width()/2, preview_y - 80 - self.block_size))
+    def draw_cell(self, surface, rect, color):
+        pygame.draw.rect(surface, color, rect, 0)
+        # grid lines run along the top and left edge of every cell and use the frame color
+        pygame.draw.line(surface, FRAME_COLOR, rect.topleft, rect.topright)
+        pygame.draw.line(surface, FRAME_COLOR, rect.topleft, rect.bottomleft)
 
-        # draw max score
-        label = SCORE_FONT.render(f'MAX SCORE: {get_max_score() if get_max_score() else 0}', True, TEXT_COLOR)
-        surface.blit(label, (preview_x + 4 * self.block_size - label.get_width() / 2, preview_y + 170))
+    def scroll(self, grid, piece_pos):
+        # keep the falling piece in the middle half of the box
+        if grid.height <= self.visible_rows or not piece_pos:
+            return self.view_top
+        y = min(y for x, y in piece_pos)
+        view_top = self.view_top
+        if y < view_top + self.visible_rows // 4 or y > view_top + self.visible_rows * 3 // 4:
+            view_top = y - self.visible_rows // 2
+        return max(0, min(view_top, grid.height - self.visible_rows))
 
-        # draw timer
-        label = SCORE_FONT.render(f'TIMER: {format_timer()}', True, TEXT_COLOR)
-        surface.blit(label, (self.start_x/2 - label.get_width()/2, preview_y - 40))
+    def draw_window(self, surface, grid, piece_pos, piece_color, draw_grid, ghost_pos=()):
+        # the piece and its landing position cover the locked cells of a few rows
+        overlay = {}
+        if ghost_pos:
+            # landing position in a pale shade of the piece color
+            ghost_color = tuple((c + 3 * b) // 4 for c, b in zip(piece_color, BLOCK_COLOR))
+            for x, y in ghost_pos:
+                overlay.setdefault(y, {})[x] = ghost_color
+        for x, y in piece_pos:
+            overlay.setdefault(y, {})[x] = piece_color
 
-        # draw speed value
-        label = SCORE_FONT.render(f'SPEED LEVEL: {speed_level}', True, TEXT_COLOR)
-        surface.blit(label, (self.start_x/2 - label.get_width()/2, preview_y + 30))
+        self.background = self.get_background(surface, grid, draw_grid)
+        if self.full_redraw:
+            surface.blit(self.background, (0, 0))
+            self.drawn_rows = [[None] * grid.width for _ in range(self.visible_rows)]
+        self.view_top = self.scroll(grid, piece_pos)
 
-        # draw combo
-        label = SCORE_FONT.render(f'COMBO: {combo}', True, TEXT_COLOR)
-        surface.blit(label, (self.start_x/2 - label.get_width()/2, preview_y + 170))
+        # only the rows in view are compared with what the surface shows, so a frame costs
+        # the same on a 1000 row board; a scroll simply finds most rows changed
+        dirty = []
+        bricks = False
+        colors = grid.colors
+        for i in range(min(self.visible_rows, grid.height - self.view_top)):
+            y = self.view_top + i
+            row = colors[y]
+            if y in overlay:
+                row = row[:]
+                for x, color in overlay[y].items():
+                    row[x] = color
+            previous = self.drawn_rows[i]
+            if row == previous:
+                continue
+            for x, color in enumerate(row):
+                if color != previous[x]:
+                    rect = self.cell_rect(x, i)
+                    if color is None:
+                        surface.blit(self.background, rect, rect)
+                    else:
+                        self.draw_cell(surface, rect, color)
+                        bricks = True
+                    dirty.append(rect)
+            self.drawn_rows[i] = row if y in overlay else row[:]
+        if bricks:
+            # cells along the edges are partly covered by the border
+            pygame.draw.rect(surface, FRAME_COLOR, (self.start_x, self.start_y, self.box_width, self.box_height),
+                             self.border)
+        return [surface.get_rect()] if self.full_redraw else dirty
 
-        # max combo
-        label = SCORE_FONT.render(f'MAX COMBO: {max_combo}', True, TEXT_COLOR)
-        surface.blit(label, (self.start_x/2 - label.get_width()/2, preview_y + 100))
-
-        for i, row in enumerate(formatted):
-            for j, column in enumerate(row):
-                if column == '0':
-                    pygame.draw.rect(surface, shape.color, (preview_x + (j + 1.5) * self.block_size, preview_y + (i - 1) * self.block_size,
-                                                            self.block_size, self.block_size), 0)
+    def draw_label(self, surface, key, text, center_x, y, full_redraw):
+        previous = self.labels.get(key)
+        if not full_redraw and previous and previous[0] == text:
+            return []
+
+        label = render_text(get_font('score'), text, TEXT_COLOR)
+        rect = label.get_rect(topleft=(center_x - label.get_width() / 2, y))
+        # long numbers next to a wide box would run off the screen
+        rect.clamp_ip(surface.get_rect())
+        dirty = [rect]
+        if previous and not full_redraw:
+            surface.blit(self.background, previous[1], previous[1])
+            dirty.append(previous[1])
+        surface.blit(label, rect)
+        self.labels[key] = (text, rect)
+        return dirty
+
+    def draw_preview_box(self, surface, shape):
+        preview_x, preview_y = self.preview_x, self.preview_y
+        size = PREVIEW_BLOCK_SIZE
+        box = pygame.Rect(preview_x + 1.5 * size, preview_y - 2 * size, 5 * size, 6 * size).inflate(4, 4)
+        surface.blit(self.background, box, box)
+
+        formatted = ROTATIONS[shape.index][shape.rotation % len(ROTATIONS[shape.index])]
+        for x, y in formatted:
+            pygame.draw.rect(surface, shape.color, (preview_x + (x + 3.5) * size, preview_y + (y + 3) * size, size, size), 0)
+        # the piece may cover the frame, draw it again on top
+        self.draw_preview_borders(surface)
+        return box
+
+    def draw_preview_borders(self, surface):
+        preview_x, preview_y = self.preview_x, self.preview_y
+        size = PREVIEW_BLOCK_SIZE
         # draw horizontal borders
-        pygame.draw.line(surface, FRAME_COLOR, (preview_x + 1.5 * self.block_size, preview_y - 2 * self.block_size),
-                         (preview_x + 6.5 * self.block_size, preview_y - 2 * self.block_size), width=3)
-        pygame.draw.line(surface, FRAME_COLOR, (preview_x + 1.5 * self.block_size, preview_y + 4 * self.block_size),
-                         (preview_x + 6.5 * self.block_size, preview_y + 4 * self.block_size), width=3)
+        pygame.draw.line(surface, FRAME_COLOR, (preview_x + 1.5 * size, preview_y - 2 * size),
+                         (preview_x + 6.5 * size, preview_y - 2 * size), width=3)
+        pygame.draw.line(surface, FRAME_COLOR, (preview_x + 1.5 * size, preview_y + 4 * size),
+                         (preview_x + 6.5 * size, preview_y + 4 * size), width=3)
         # draw vertical borders
-        pygame.draw.line(surface, FRAME_COLOR, (preview_x + 1.5 * self.block_size, preview_y - 2 * self.block_size),
-                         (preview_x + 1.5 * self.block_size, preview_y + 4 * self.block_size), width=3)
-        pygame.draw.line(surface, FRAME_COLOR, (preview_x + 6.5 * self.block_size, preview_y - 2 * self.block_size),
-                         (preview_x + 6.5 * self.block_size, preview_y + 4 * self.block_size), width=3)
\ No newline at end of file
+        pygame.draw.line(surface, FRAME_COLOR, (preview_x + 1.5 * size, preview_y - 2 * size),
+                         (preview_x + 1.5 * size, preview_y + 4 * size), width=3)
+        pygame.draw.line(surface, FRAME_COLOR, (preview_x + 6.5 * size, preview_y - 2 * size),
+                         (preview_x + 6.5 * size, preview_y + 4 * size), width=3)
+
+    # called after draw_window, which decides whether this frame repaints everything
+    def draw_next_shape(self, shape, surface, score, get_max_score, format_timer, speed_level, combo, max_combo):
+        full_redraw = self.full_redraw
+        self.full_redraw = False
+        preview_x, preview_y = self.preview_x, self.preview_y
+        left_x = self.start_x / 2
+        right_x = preview_x + 4 * PREVIEW_BLOCK_SIZE
+        max_score = get_max_score()
+
+        dirty = []
+        # draw score
+        dirty += self.draw_label(surface, 'score', f'SCORE: {score}', left_x, preview_y - 80 - PREVIEW_BLOCK_SIZE,
+                                 full_redraw)
+        # draw max score
+        dirty += self.draw_label(surface, 'max_score', f'MAX SCORE: {max_score if max_score else 0}', right_x,
+                                 preview_y + 170, full_redraw)
+        # draw timer
+        dirty += self.draw_label(surface, 'timer', f'TIMER: {format_timer()}', left_x, preview_y - 40, full_redraw)
+        # draw speed value
+        dirty += self.draw_label(surface, 'speed', f'SPEED LEVEL: {speed_level}', left_x, preview_y + 30, full_redraw)
+        # draw combo
+        dirty += self.draw_label(surface, 'combo', f'COMBO: {combo}', left_x, preview_y + 170, full_redraw)
+        # max combo
+        dirty += self.draw_label(surface, 'max_combo', f'MAX COMBO: {max_combo}', left_x, preview_y + 100, full_redraw)
+
+        preview = (shape.index, shape.rotation % len(ROTATIONS[shape.index]))
+        if full_redraw or preview != self.preview:
+            dirty.append(self.draw_preview_box(surface, shape))
+            self.preview = preview
+
+        return [] if full_redraw else dirty
+
+    def draw_profiler(self, surface, profiler):
+        # overlay in the top left corner, toggled with F3
+        dirty = []
+        if self.profiler_rect:
+            surface.blit(self.background, self.profiler_rect, self.profiler_rect)
+            dirty.append(self.profiler_rect)
+            self.profiler_rect = None
+        if not profiler.enabled:
+            return dirty
+
+        lines = [f'{"phase":<16}{"p50":>8}{"p95":>8}{"p99":>8}  ms']
+        for phase, values in profiler.report().items():
+            lines.append(f'{phase:<16}' + ''.join(f'{value:8.2f}' for value in values))
+        rect = pygame.Rect(5, 5, 0, 0)
+        y = rect.y
+        for line in lines:
+            # timings change every frame, so they skip the text cache
+            label = get_font('profiler').render(line, True, TEXT_COLOR)
+            surface.blit(label, (rect.x, y))
+            rect.width = max(rect.width, label.get_width())
+            y += label.get_height()
+        rect.height = y - rect.y
+        self.profiler_rect = rect
+        dirty.append(rect)
+        return dirty
@@ -0,0 +1,181 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from game import LEFT, RIGHT, ROTATE, DROP
+from shapes import ROTATIONS, BOUNDS
+from validation import valid_placement, drop_distance
+
+LOST = float('-inf')
+
+
+# weighted sum of the board features, the default weights are a well known
+# hand-tuned set for 10x20 boards
+class LinearHeuristic(object):
+    def __init__(self, height=-0.510066, lines=0.760666, holes=-0.35663, bumpiness=-0.184483):
+        self.height = height
+        self.lines = lines
+        self.holes = holes
+        self.bumpiness = bumpiness
+
+    def __call__(self, aggregate_height, holes, bumpiness, lines):
+        return (self.height * aggregate_height + self.lines * lines + self.holes * holes
+                + self.bumpiness * bumpiness)
+
+
+# just the row masks and column tops of a board, enough for valid_placement and
+# drop_distance and much cheaper to copy than a BitBoard; rows above `top` are empty
+class SimBoard(object):
+    def __init__(self, rows, width, height, top=0):
+        self.rows = rows
+        self.width = width
+        self.height = height
+        self.top = top
+        self.full_row = (1 << width) - 1
+        self.tops = [height] * width
+        self.holes = 0
+        # one pass from the top of the stack finds every column top and every empty cell under one
+        seen = 0
+        for y in range(top, height):
+            row = rows[y]
+            new = row & ~seen
+            while new:
+                low = new & -new
+                self.tops[low.bit_length() - 1] = y
+                new ^= low
+            seen |= row
+            self.holes += bin(seen & ~row).count('1')
+
+    def features(self):
+        heights = [self.height - top for top in self.tops]
+        bumpiness = sum(abs(a - b) for a, b in zip(heights, heights[1:]))
+        return sum(heights), self.holes, bumpiness
+
+    def place(self, index, rotation, x, y):
+        # lock the piece and clear rows, returns the new board and the number of cleared lines
+        rows = self.rows[:]
+        top = self.top
+        for dx, dy in ROTATIONS[index][rotation]:
+            if y + dy < 0:
+                return None, 0
+            rows[y + dy] |= 1 << (x + dx)
+            top = min(top, y + dy)
+        # only the rows of the piece can have become full
+        full = sorted(set(y + dy for dx, dy in ROTATIONS[index][rotation] if rows[y + dy] == self.full_row))
+        for i in reversed(full):
+            del rows[i]
+        lines = len(full)
+        if lines:
+            rows[:0] = [0] * lines
+        if rows[0]:
+            # a brick left in the top row loses the game
+            return None, 0
+        # everything above the old top moved down with the cleared lines
+        return SimBoard(rows, self.width, self.height, top + lines), lines
+
+
+def placements(board, index, rotation, x, y):
+    # every (rotation, x) the piece can reach from where it is by rotating in place and
+    # then sliding sideways, with the row it lands on
+    count = len(ROTATIONS[index])
+    result = []
+    current = rotation % count
+    for turns in range(count):
+        target = (current + turns) % count
+        if not valid_placement(board, index, target, x, y):
+            break
+        min_x, min_y, max_x, max_y = BOUNDS[index][target]
+        left = x
+        while left + min_x > 0 and valid_placement(board, index, target, left - 1, y):
+            left -= 1
+        right = x
+        while right + max_x < board.width - 1 and valid_placement(board, index, target, right + 1, y):
+            right += 1
+        for column in range(left, right + 1):
+            result.append((turns, target, column, y + drop_distance(board, index, target, column, y)))
+    return result
+
+
+def best_followups(job):
+    # a whole share of the beam in one job, so a process pool pays one round trip per worker
+    # and decision rather than one per candidate
+    boards, index, heuristic = job
+    return [best_followup((board, index, lines, heuristic)) for board, lines in boards]
+
+
+def best_followup(job):
+    # best score reachable with the next piece on a board left by the current one
+    board, index, lines, heuristic = job
+    best = LOST
+    # the next piece starts where Game spawns it, in the middle of the top row
+    for turns, rotation, x, y in placements(board, index, 0, board.width // 2, 0):
+        child, child_lines = board.place(index, rotation, x, y)
+        if child is None:
+            continue
+        score = heuristic(*child.features(), lines + child_lines)
+        if score > best:
+            best = score
+    return best
+
+
+class Bot(object):
+    def __init__(self, heuristic=None, beam_width=5, workers=0, executor='thread', actions_per_frame=None):
+        self.heuristic = heuristic or LinearHeuristic()
+        self.beam_width = beam_width
+        self.workers = workers
+        self.actions_per_frame = actions_per_frame
+        self.pool = None
+        if workers:
+            self.pool = (ProcessPoolExecutor if executor == 'process' else ThreadPoolExecutor)(workers)
+        self.decisions = 0
+        self._piece = None
+        self._plan = []
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def choose(self, grid, piece, next_index):
+        board = SimBoard(grid.rows[:], grid.width, grid.height, grid.top)
+        candidates = []
+        for turns, rotation, x, y in placements(board, piece.index, piece.rotation, piece.x, piece.y):
+            child, lines = board.place(piece.index, rotation, x, y)
+            if child is not None:
+                candidates.append((self.heuristic(*child.features(), lines), turns, x, child, lines))
+        if not candidates:
+            return None
+        self.decisions += 1
+
+        # beam search: only the best placements of this piece are tried with the next one
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        beam = candidates[:self.beam_width]
+        if self.pool is not None:
+            # the beam dealt out into one share per worker
+            shares = min(self.workers, len(beam))
+            boards = [(child, lines) for score, turns, x, child, lines in beam]
+            jobs = [(boards[i::shares], next_index, self.heuristic) for i in range(shares)]
+            results = list(self.pool.map(best_followups, jobs))
+            scores = [results[i % shares][i // shares] for i in range(len(beam))]
+        else:
+            scores = [best_followup((child, next_index, lines, self.heuristic))
+                      for score, turns, x, child, lines in beam]
+
+        best = max(range(len(beam)), key=lambda i: (scores[i], beam[i][0]))
+        score, turns, x, child, lines = beam[best]
+        return turns, x - piece.x
+
+    def plan(self, game):
+        choice = self.choose(game.grid, game.current_piece, game.next_piece.index)
+        if choice is None:
+            return [DROP]
+        turns, dx = choice
+        return [ROTATE] * turns + [RIGHT if dx > 0 else LEFT] * abs(dx) + [DROP]
+
+    def get_actions(self, game):
+        # inputs for this frame; a new plan is made whenever a new piece shows up
+        if game.current_piece is not self._piece:
+            self._piece = game.current_piece
+            self._plan = self.plan(game)
+        if self.actions_per_frame is None:
+            actions, self._plan = self._plan, []
+        else:
+            actions, self._plan = self._plan[:self.actions_per_frame], self._plan[self.actions_per_frame:]
+        return actions
@@ -0,0 +1,191 @@
+import argparse
+import json
+import random
+import socket
+from bitboard import BitBoard
+from game import Piece, SURVIVAL, convert_shape_format
+from protocol import (FRAME, NEW, INPUT, WATCH, STATS, STATE, NEW_GAME, SESSION_ID, encode_frame,
+                      decode_state)
+from server import DEFAULT_ADDRESS, parse_address
+from validation import drop_distance
+
+
+def connect(address):
+    host, port = parse_address(address)
+    if port is None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(host)
+    else:
+        sock = socket.create_connection((host, port))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+def read_frame(sock):
+    # blocking read of one whole message
+    header = read_exactly(sock, FRAME.size)
+    length, kind = FRAME.unpack(header)
+    return kind, read_exactly(sock, length)
+
+
+def read_exactly(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError('server closed the connection')
+        data += chunk
+    return bytes(data)
+
+
+def get_stats(address):
+    sock = connect(address)
+    try:
+        sock.sendall(encode_frame(STATS))
+        kind, payload = read_frame(sock)
+        return json.loads(payload)
+    finally:
+        sock.close()
+
+
+# mirror of a game running on the server, with the attributes the game loop, the
+# renderer and the bot read from a Game; inputs go to the server and advance()
+# applies the state it sent back
+class RemoteGame(object):
+    def __init__(self, player, address=DEFAULT_ADDRESS, mode=SURVIVAL, seed=None, width=10, height=20,
+                 session_id=None):
+        self.player = player
+        self.mode = mode
+        self.recorder = None
+        self.lost = False
+        self.ticks = 0
+        self.lines = 0
+        self.pieces = 0
+        self.cleared_rows = []
+        self.sock = connect(address)
+        if session_id is None:
+            player.restart_stats()
+            seed = random.getrandbits(64) if seed is None else seed
+            self.sock.sendall(encode_frame(NEW, NEW_GAME.pack(seed, player.start_speed_level, mode, width, height)))
+        else:
+            # only watch a game somebody else plays
+            self.sock.sendall(encode_frame(WATCH, SESSION_ID.pack(session_id)))
+        self.buffer = bytearray()
+
+        kind, payload = read_frame(self.sock)
+        state = decode_state(payload)
+        self.session_id = state['session_id']
+        self.grid = BitBoard(state['width'], state['height'])
+        self.current_piece = None
+        self.next_piece = None
+        self.apply_state(state)
+        self.sock.setblocking(False)
+
+    def close(self):
+        self.sock.close()
+
+    def apply_state(self, state):
+        self.ticks = state['tick']
+        self.lines = state['lines']
+        self.lost = state['lost']
+        if state['full']:
+            # a full state only lists the rows with bricks in them
+            self.grid.reset()
+        if state['rows']:
+            self.grid.set_rows(state['rows'])
+        index, rotation, x, y = state['piece']
+        if self.current_piece is None or state['pieces'] != self.pieces:
+            # a new piece; the same one keeps its object, which is how the bot tells them apart
+            self.current_piece = Piece(x, y, index)
+            self.pieces = state['pieces']
+        self.current_piece.x, self.current_piece.y, self.current_piece.rotation = x, y, rotation
+        if self.next_piece is None or self.next_piece.index != state['next']:
+            self.next_piece = Piece(self.grid.width // 2, 0, state['next'])
+
+        player = self.player
+        player.score = state['score']
+        player.speed_level = state['speed_level']
+        player.combo = state['combo']
+        player.max_combo = state['max_combo']
+        player.timer = state['timer']
+
+    def apply_action(self, action):
+        if not self.lost:
+            self.sock.sendall(encode_frame(INPUT, bytes((action,))))
+
+    def advance(self, dt):
+        # take whatever the server sent since the last frame
+        try:
+            while True:
+                chunk = self.sock.recv(65536)
+                if not chunk:
+                    self.lost = True
+                    break
+                self.buffer += chunk
+        except BlockingIOError:
+            pass
+        except ConnectionError:
+            self.lost = True
+
+        pos = 0
+        while len(self.buffer) - pos >= FRAME.size:
+            length, kind = FRAME.unpack_from(self.buffer, pos)
+            end = pos + FRAME.size + length
+            if end > len(self.buffer):
+                break
+            if kind == STATE:
+                self.apply_state(decode_state(bytes(self.buffer[pos + FRAME.size:end])))
+            pos = end
+        del self.buffer[:pos]
+        return 0
+
+    def update(self, dt, actions=()):
+        for action in actions:
+            self.apply_action(action)
+        return self.advance(dt)
+
+    def ghost_positions(self):
+        piece = self.current_piece
+        distance = drop_distance(self.grid, piece.index, piece.rotation, piece.x, piece.y)
+        return [(x, y + distance) for x, y in convert_shape_format(piece)]
+
+
+def watch(address, session_id):
+    # follow a game in a window, like a cabinet showing a tournament match
+    import pygame
+    from main import FPS, bootstrap, create_board, draw_game
+    from player import Player
+
+    win = bootstrap()
+    game = RemoteGame(Player(), address, session_id=session_id)
+    board = create_board(game.grid)
+    clock = pygame.time.Clock()
+    while not game.lost:
+        clock.tick(FPS)
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+                game.close()
+                return
+        game.advance(clock.get_time())
+        draw_game(win, board, game)
+    game.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Look at the games on a game server.')
+    parser.add_argument('command', choices=['stats', 'watch'])
+    parser.add_argument('session', nargs='?', type=int, help='session to watch')
+    parser.add_argument('--address', default=DEFAULT_ADDRESS, help=f'host:port or unix socket path '
+                                                                   f'(default: {DEFAULT_ADDRESS})')
+    args = parser.parse_args()
+
+    if args.command == 'stats':
+        print(json.dumps(get_stats(args.address), indent=2))
+    else:
+        if args.session is None:
+            parser.error('watch needs a session id, see the stats command')
+        watch(args.address, args.session)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+import random
+from bitboard import BitBoard
+from shapes import SHAPES, SHAPE_COLORS, ROTATIONS
+from validation import valid_space, check_lost, drop_distance
+from profiler import PROFILER
+
+# GAME MODES
+ENDLESS, SURVIVAL, HARDCORE = 0, 1, 2
+# by name, for the command line tools
+MODES = {'endless': ENDLESS, 'survival': SURVIVAL, 'hardcore': HARDCORE}
+
+# ACTIONS
+LEFT, RIGHT, DOWN, ROTATE, DROP = 0, 1, 2, 3, 4
+
+# length of one simulation step in milliseconds
+STEP_TIME = 10
+# longest stall that is caught up on, anything above is dropped (e.g. while the window is dragged)
+MAX_FRAME_TIME = 1000
+
+# BOARD SIZE in cells, every piece fits into the smallest box
+MIN_WIDTH, MIN_HEIGHT = 4, 4
+MAX_WIDTH, MAX_HEIGHT = 100, 1000
+
+
+class Piece(object):
+    def __init__(self, x, y, index):
+        self.x = x
+        self.y = y
+        self.index = index
+        self.shape = SHAPES[index]
+        self.color = SHAPE_COLORS[index]
+        self.rotation = 0
+
+
+def get_shape(rng=random, x=5):
+    return Piece(x, 0, rng.randrange(len(SHAPES)))
+
+
+def convert_shape_format(block):
+    rotations = ROTATIONS[block.index]
+    x, y = block.x, block.y
+    return [(x + dx, y + dy) for dx, dy in rotations[block.rotation % len(rotations)]]
+
+
+def check_board_size(width, height):
+    if not (MIN_WIDTH <= width <= MAX_WIDTH and MIN_HEIGHT <= height <= MAX_HEIGHT):
+        raise ValueError(f'board size must be between {MIN_WIDTH}x{MIN_HEIGHT} and {MAX_WIDTH}x{MAX_HEIGHT}, '
+                         f'got {width}x{height}')
+
+
+def clear_rows(grid, player, mode=SURVIVAL, rows=None):
+    cleared = grid.clear_rows(rows)  # indices of deleted rows
+    num_del = len(cleared)
+    if num_del > 0:
+        player.extra_speed += num_del
+        player.combo += num_del
+        player.max_combo = player.combo if player.combo > player.max_combo else player.max_combo
+        if mode == SURVIVAL and player.fall_speed > 0.1:
+            player.fall_speed -= player.extra_speed * 0.005
+            player.speed_level += player.extra_speed
+    else:
+        player.combo = 0
+
+    return cleared
+
+
+# rules of a single game without any display, fonts or event loop; a front end
+# calls apply_action() for each input and advance() with the elapsed milliseconds,
+# which runs as many fixed STEP_TIME ticks as fit, so the game speed does not
+# depend on the frame rate
+class Game(object):
+    def __init__(self, player, mode=SURVIVAL, rng=None, width=10, height=20):
+        check_board_size(width, height)
+        self.player = player
+        self.mode = mode
+        self.rng = rng if rng is not None else random.Random()
+        self.grid = BitBoard(width, height)
+        # pieces drop in at the middle of the top row
+        self.spawn_x = width // 2
+        self.current_piece = get_shape(self.rng, self.spawn_x)
+        self.next_piece = get_shape(self.rng, self.spawn_x)
+        self.change_piece = False
+        self.fall_time = 0
+        self.hardcore_time = 0
+        self.time_elapsed = 0
+        self.accumulator = 0
+        self.ticks = 0
+        self.lines = 0
+        self.pieces = 0
+        self.lost = False
+        self.cleared_rows = []
+        self.recorder = None
+
+        player.restart_stats()
+
+    def advance(self, dt):
+        # run every whole step that fits into the time passed since the last call,
+        # a slow frame runs several steps in a row instead of slowing the game down
+        self.accumulator += min(dt, MAX_FRAME_TIME)
+        num_del = 0
+        while self.accumulator >= STEP_TIME and not self.lost:
+            self.accumulator -= STEP_TIME
+            num_del += self.tick()
+        return num_del
+
+    @property
+    def interpolation(self):
+        # how far the game is into the next step, for renderers that want to smooth motion
+        return self.accumulator / STEP_TIME
+
+    def tick(self):
+        player = self.player
+        self.ticks += 1
+        self.fall_time += STEP_TIME
+        self.time_elapsed += STEP_TIME
+        if self.mode == HARDCORE:
+            self.hardcore_time += STEP_TIME
+
+        # thresholds are subtracted rather than reset so no time is lost
+        while self.time_elapsed >= 1000:
+            self.time_elapsed -= 1000
+            player.timer += 1
+
+        while self.hardcore_time >= 5000:
+            self.hardcore_time -= 5000
+            if player.fall_speed > 0.1:
+                player.fall_speed -= 0.005
+                player.speed_level += 1
+
+        if self.fall_time >= player.fall_speed * 1000:
+            self.fall_time -= player.fall_speed * 1000
+            self.fall()
+
+        return self.step()
+
+    def fall(self):
+        piece = self.current_piece
+        piece.y += 1
+        if not valid_space(piece, self.grid) and piece.y > 0:
+            piece.y -= 1
+            self.change_piece = True
+
+    def move(self, dx, dy, rotation=0):
+        piece = self.current_piece
+        piece.x += dx
+        piece.y += dy
+        piece.rotation += rotation
+        if not valid_space(piece, self.grid):
+            piece.x -= dx
+            piece.y -= dy
+            piece.rotation -= rotation
+            return False
+        return True
+
+    def apply_action(self, action):
+        if self.recorder is not None:
+            self.recorder.record(self.ticks, action)
+        if action == LEFT:
+            self.move(-1, 0)
+        elif action == RIGHT:
+            self.move(1, 0)
+        elif action == DOWN:
+            self.move(0, 1)
+        elif action == ROTATE:
+            self.move(0, 0, 1)
+        elif action == DROP:
+            piece = self.current_piece
+            piece.y += drop_distance(self.grid, piece.index, piece.rotation, piece.x, piece.y)
+
+    def ghost_positions(self):
+        # where the current piece would land
+        piece = self.current_piece
+        distance = drop_distance(self.grid, piece.index, piece.rotation, piece.x, piece.y)
+        return [(x, y + distance) for x, y in convert_shape_format(piece)]
+
+    def step(self):
+        num_del = 0
+        if self.change_piece:
+            player = self.player
+            shape_pos = convert_shape_format(self.current_piece)
+            self.grid.lock(shape_pos, self.current_piece.color)
+            if self.recorder is not None:
+                self.recorder.flush()
+            self.current_piece = self.next_piece
+            self.next_piece = get_shape(self.rng, self.spawn_x)
+            self.change_piece = False
+            self.pieces += 1
+            # the renderer can use the cleared rows to tell which part of the box moved
+            PROFILER.begin('clear_rows')
+            self.cleared_rows = clear_rows(self.grid, player, self.mode, [y for x, y in shape_pos])
+            PROFILER.end('clear_rows')
+            num_del = len(self.cleared_rows)
+            self.lines += num_del
+            player.score += num_del * player.get_score_factor()
+            self.lost = check_lost(self.grid)
+        return num_del
+
+    def update(self, dt, actions=()):
+        for action in actions:
+            self.apply_action(action)
+        return self.advance(dt)
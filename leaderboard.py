@@ -1,12 +1,13 @@
 import pygame
-import csv
-import sys
-from board import TITLE_FONT, SCORE_FONT, BACKGROUND_COLOR, TEXT_COLOR
-from menu import ACTIVE_COLOR
+from board import get_font, BACKGROUND_COLOR, TEXT_COLOR
+from textcache import render_text
+from menu import ACTIVE_COLOR, wait_events
+from scoredb import SCORE_INDEX
+from scorewriter import SCORE_WRITER
 
 
 def draw_leaderboard(win, leaderboard, width, height):
-    menu_text = TITLE_FONT.render('LEADERBOARD', True, TEXT_COLOR)
+    menu_text = render_text(get_font('title'), 'LEADERBOARD', TEXT_COLOR)
     win.blit(menu_text, (width / 2 - menu_text.get_width() / 2, height / 2 - 350))
 
     width_btn = -450
@@ -15,18 +16,18 @@ def draw_leaderboard(win, leaderboard, width, height):
         for index, j in enumerate(v):
             # draw title row
             if i == 0:
-                label = SCORE_FONT.render(j, True, ACTIVE_COLOR)
+                label = render_text(get_font('score'), j, ACTIVE_COLOR)
                 button_x = width / 2 - label.get_width() / 2
                 win.blit(label, (button_x + width_btn, height / 3 - 100))
             else:
                 # draw place of score
                 if index == 0:
-                    label = SCORE_FONT.render(str(i), True, TEXT_COLOR)
+                    label = render_text(get_font('score'), str(i), TEXT_COLOR)
                     button_x = width / 2 - label.get_width() / 2
                     win.blit(label, (button_x + width_btn, height / 3 + height_btn))
                     width_btn += 150
                 # draw score and time
-                label = SCORE_FONT.render(j, True, TEXT_COLOR)
+                label = render_text(get_font('score'), j, TEXT_COLOR)
                 button_x = width / 2 - label.get_width() / 2
                 win.blit(label, (button_x + width_btn, height / 3 + height_btn))
             width_btn += 150
@@ -34,17 +35,12 @@ def draw_leaderboard(win, leaderboard, width, height):
         height_btn += 50
 
 
-def get_leaderboard(win, width, height):
-    rows = [['No.', 'Name', 'Score', 'Speed Level', 'Time', 'Max Combo', 'Date']]
-    with open('scores.csv', 'a+') as f:
-        f.seek(0)
-        reader = csv.reader(f, delimiter=',')
-        for row in reader:
-            rows.append(row)
-    try:
-        leaderboard = [rows[0]] + sorted(rows[1:], key=lambda x: int(x[1]), reverse=True)[:10]
-    except:
-        leaderboard = [rows[0]]
+def get_leaderboard(win, width, height, speed_level=None, mode=None):
+    leaderboard = [['No.', 'Name', 'Score', 'Speed Level', 'Time', 'Max Combo', 'Date']]
+    # the index reads the file, so a score that was just saved has to be in it
+    SCORE_WRITER.flush()
+    for record in SCORE_INDEX.top(10, speed_level, mode):
+        leaderboard.append([str(field) for field in record[:6]])
 
     high_scores = True
 
@@ -53,10 +49,11 @@ def get_leaderboard(win, width, height):
         draw_leaderboard(win, leaderboard, width, height)
         pygame.display.update()
 
-        for event in pygame.event.get():
+        for event in wait_events():
             if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
+                # hand the quit on to the screen we return to
+                pygame.event.post(event)
+                return
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE:
                     high_scores = False
@@ -0,0 +1,143 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from game import DROP, SURVIVAL
+from paths import BASE_DIR
+from protocol import FRAME, NEW, INPUT, STATS, NEW_GAME, encode_frame
+
+# key presses per second of every simulated player
+INPUT_RATE = 4
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def read_frame(reader):
+    length, kind = FRAME.unpack(await reader.readexactly(FRAME.size))
+    return kind, await reader.readexactly(length)
+
+
+async def player(address, seed, width, height, stop):
+    # one simulated player: starts a game, presses random keys and throws the updates away
+    host, port = address
+    reader, writer = await asyncio.open_connection(host, port)
+    rng = random.Random(seed)
+    writer.write(encode_frame(NEW, NEW_GAME.pack(seed, 30, SURVIVAL, width, height)))
+
+    async def drain_updates():
+        while await reader.read(65536):
+            pass
+
+    updates = asyncio.ensure_future(drain_updates())
+    try:
+        while not stop.is_set() and not updates.done():
+            await asyncio.sleep(rng.expovariate(INPUT_RATE))
+            # no hard drops, so the games last for the whole run
+            writer.write(encode_frame(INPUT, bytes((rng.randrange(DROP),))))
+    finally:
+        updates.cancel()
+        writer.close()
+
+
+async def get_stats(address):
+    reader, writer = await asyncio.open_connection(*address)
+    writer.write(encode_frame(STATS))
+    kind, payload = await read_frame(reader)
+    writer.close()
+    return json.loads(payload)
+
+
+async def run_level(address, sessions, seconds, warmup, width, height, seed):
+    stop = asyncio.Event()
+    tasks = [asyncio.ensure_future(player(address, seed + i, width, height, stop)) for i in range(sessions)]
+    await asyncio.sleep(warmup)
+    # the first call only resets the counters
+    await get_stats(address)
+    await asyncio.sleep(seconds)
+    stats = await get_stats(address)
+    stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    # give the server a moment to drop the finished sessions
+    await asyncio.sleep(0.5)
+    return stats
+
+
+def summarize(stats):
+    # the server is one process on one core, so its cpu share says how many cores the sessions take
+    load = stats['cpu_seconds'] / stats['seconds'] if stats['seconds'] else 0
+    return {
+        'sessions': stats['active'],
+        'cpu_load': load,
+        'sessions_per_core': stats['active'] / load if load else 0,
+        'ticks_per_second': stats['ticks'] / stats['seconds'] if stats['seconds'] else 0,
+        'p50_ms': stats['latency_ms']['p50'],
+        'p99_ms': stats['latency_ms']['p99'],
+        'max_ms': stats['latency_ms']['max'],
+    }
+
+
+async def run(levels, seconds, warmup, width, height, batch, max_p99, seed):
+    port = free_port()
+    server = subprocess.Popen([sys.executable, os.path.join(BASE_DIR, 'server.py'), f'127.0.0.1:{port}',
+                               '--batch', str(batch)], stdout=subprocess.DEVNULL)
+    address = ('127.0.0.1', port)
+    try:
+        # wait until the server accepts connections
+        for _ in range(100):
+            try:
+                await get_stats(address)
+                break
+            except OSError:
+                await asyncio.sleep(0.1)
+
+        results = []
+        print(f'{"sessions":>9}{"cpu":>7}{"per core":>10}{"ticks/s":>10}{"p50 ms":>9}{"p99 ms":>9}{"max ms":>9}')
+        for sessions in levels:
+            result = summarize(await run_level(address, sessions, seconds, warmup, width, height, seed))
+            results.append(result)
+            print(f'{result["sessions"]:>9}{result["cpu_load"]:>7.0%}{result["sessions_per_core"]:>10.0f}'
+                  f'{result["ticks_per_second"]:>10.0f}{result["p50_ms"]:>9.2f}{result["p99_ms"]:>9.2f}'
+                  f'{result["max_ms"]:>9.2f}')
+            if result['p99_ms'] > max_p99:
+                print(f'p99 tick latency above {max_p99} ms, stopping')
+                break
+        return results
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test a local game server with simulated players.')
+    parser.add_argument('levels', nargs='*', type=int, default=[10, 50, 100, 200, 400, 800],
+                        help='numbers of concurrent sessions to try (default: 10 50 100 200 400 800)')
+    parser.add_argument('--seconds', type=float, default=5, help='measured seconds per level')
+    parser.add_argument('--warmup', type=float, default=1)
+    parser.add_argument('--width', type=int, default=10)
+    parser.add_argument('--height', type=int, default=20)
+    parser.add_argument('--batch', type=int, default=1, help='ticks a session runs per wake-up on the server')
+    parser.add_argument('--max-p99', type=float, default=10, help='stop once the p99 tick latency (ms) is above this')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = asyncio.run(run(args.levels, args.seconds, args.warmup, args.width, args.height, args.batch,
+                              args.max_p99, args.seed))
+    print(f'finished in {time.perf_counter() - start:.0f}s')
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,219 +1,153 @@
+import os
 import pygame
 import random
-import sys
-from grid import create_grid, draw_grid, BLOCK_COLOR
+import time
+from grid import draw_grid
 from player import Player
 from leaderboard import get_leaderboard
-from menu import draw_menu, pause, ACTIVE_COLOR
-from validation import valid_space, check_lost
-from board import Board, BACKGROUND_COLOR, TEXT_COLOR, TITLE_FONT, SCORE_FONT
+from menu import draw_menu, pause, wait_events, ACTIVE_COLOR
+from board import Board, BACKGROUND_COLOR, TEXT_COLOR, FONTS, MAX_BOX_WIDTH, MAX_BOX_HEIGHT, get_font
+from game import Game, check_board_size, convert_shape_format, LEFT, RIGHT, DOWN, ROTATE, DROP
+from textcache import render_text
+from replay import ReplayPlayer, start_recording, MAX_REPLAYS
+from profiler import PROFILER
+from bot import Bot
+from client import RemoteGame
+from paths import BASE_DIR
+from scorewriter import SCORE_WRITER
+
+# FRAME RATE, 0 runs the game loop uncapped
+FPS = int(os.environ.get('TETRIS_FPS', 60))
+VSYNC = os.environ.get('TETRIS_VSYNC') == '1'
+
+# every game is recorded here, an empty value turns recording off; only the newest
+# TETRIS_REPLAY_KEEP recordings are kept
+REPLAY_DIR = os.environ.get('TETRIS_REPLAY_DIR', os.path.join(BASE_DIR, 'replays'))
+REPLAY_KEEP = int(os.environ.get('TETRIS_REPLAY_KEEP', MAX_REPLAYS))
+
+# play on a game server (host:port or a unix socket path) instead of locally
+SERVER = os.environ.get('TETRIS_SERVER')
+
+# let the bot play, e.g. for attract mode; the value is the number of key presses per frame
+AUTOPLAY = int(os.environ.get('TETRIS_AUTOPLAY', 0))
+# processes the bot spreads its look-ahead over, 0 keeps it in the game loop
+AUTOPLAY_WORKERS = int(os.environ.get('TETRIS_AUTOPLAY_WORKERS', 0))
 
 # SIZE OF SCREEN
 WIDTH, HEIGHT = 1100, 750
-WIN = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption('TETRIS')
-pygame.init()
-
-# SIZE OF BOX
-BLOCK_SIZE = 30
-BOX_WIDTH, BOX_HEIGHT = 10 * BLOCK_SIZE, 20 * BLOCK_SIZE
-
-# BEGIN POINT OF BOX
-START_BOX_X = (WIDTH - BOX_WIDTH) // 2
-START_BOX_Y = (HEIGHT - BOX_HEIGHT) - 30
-
-# SHAPE FORMATS
-S = [['.....',
-      '......',
-      '..00..',
-      '.00...',
-      '.....'],
-     ['.....',
-      '..0..',
-      '..00.',
-      '...0.',
-      '.....']]
-
-Z = [['.....',
-      '.....',
-      '.00..',
-      '..00.',
-      '.....'],
-     ['.....',
-      '..0..',
-      '.00..',
-      '.0...',
-      '.....']]
-
-I = [['..0..',
-      '..0..',
-      '..0..',
-      '..0..',
-      '.....'],
-     ['.....',
-      '0000.',
-      '.....',
-      '.....',
-      '.....']]
-
-O = [['.....',
-      '.....',
-      '.00..',
-      '.00..',
-      '.....']]
-
-J = [['.....',
-      '.0...',
-      '.000.',
-      '.....',
-      '.....'],
-     ['.....',
-      '..00.',
-      '..0..',
-      '..0..',
-      '.....'],
-     ['.....',
-      '.....',
-      '.000.',
-      '...0.',
-      '.....'],
-     ['.....',
-      '..0..',
-      '..0..',
-      '.00..',
-      '.....']]
-
-L = [['.....',
-      '...0.',
-      '.000.',
-      '.....',
-      '.....'],
-     ['.....',
-      '..0..',
-      '..0..',
-      '..00.',
-      '.....'],
-     ['.....',
-      '.....',
-      '.000.',
-      '.0...',
-      '.....'],
-     ['.....',
-      '.00..',
-      '..0..',
-      '..0..',
-      '.....']]
-
-T = [['.....',
-      '..0..',
-      '.000.',
-      '.....',
-      '.....'],
-     ['.....',
-      '..0..',
-      '..00.',
-      '..0..',
-      '.....'],
-     ['.....',
-      '.....',
-      '.000.',
-      '..0..',
-      '.....'],
-     ['.....',
-      '..0..',
-      '.00..',
-      '..0..',
-      '.....']]
-
-SHAPES = [S, Z, I, O, J, L, T]
-SHAPE_COLORS = [(0, 255, 0), (255, 0, 0), (0, 255, 255), (255, 255, 0),
-                (255, 165, 0), (0, 0, 255), (128, 0, 128)]
+
+# SIZE OF BOARD in cells, up to 100 x 1000; TETRIS_WIDTH and TETRIS_HEIGHT are read by bootstrap()
+BOARD_WIDTH, BOARD_HEIGHT = 10, 20
+
+# SIZE OF BLOCKS, they shrink to fit big boards into the box down to MIN_BLOCK_SIZE, taller boards scroll
+MAX_BLOCK_SIZE, MIN_BLOCK_SIZE = 30, 15
+
+# KEY BINDINGS
+KEY_ACTIONS = {
+    pygame.K_LEFT: LEFT,
+    pygame.K_RIGHT: RIGHT,
+    pygame.K_DOWN: DOWN,
+    pygame.K_UP: ROTATE,
+    pygame.K_RETURN: DROP
+}
+
+# SCREENS
+MENU, PLAYING, PAUSED, NAME_ENTRY, GAME_OVER, LEADERBOARD, EXIT = range(7)
+PAUSE_CHOICES = {
+    'RESUME': PLAYING,
+    'RESTART': PLAYING,
+    'MAIN MENU': MENU,
+    'HIGH SCORES': LEADERBOARD,
+    'EXIT': EXIT
+}
 
 # GLOBAL VARIABLES
 active = 1
 mode = 1
 
 
-class Piece(object):
-    def __init__(self, x, y, shape):
-        self.x = x
-        self.y = y
-        self.shape = shape
-        self.color = SHAPE_COLORS[SHAPES.index(shape)]
-        self.rotation = 0
-
-
-def get_shape():
-    return Piece(5, 0, random.choice(SHAPES))
-
-
-def convert_shape_format(block):
-    positions = []
-    variety = block.shape[block.rotation % len(block.shape)]
-
-    for i, row in enumerate(variety):
-        for j, column in enumerate(row):
-            if '0' in column:
-                positions.append((block.x + j, block.y + i))
-
-    for i, pos in enumerate(positions):
-        positions[i] = (pos[0] - 2, pos[1] - 4)
-
-    return positions
+def read_board_size():
+    # checked before the window opens, a bad value would otherwise only fail once a game starts
+    global BOARD_WIDTH, BOARD_HEIGHT
+    try:
+        width = int(os.environ.get('TETRIS_WIDTH', BOARD_WIDTH))
+        height = int(os.environ.get('TETRIS_HEIGHT', BOARD_HEIGHT))
+        check_board_size(width, height)
+    except ValueError as e:
+        raise SystemExit(f'TETRIS_WIDTH/TETRIS_HEIGHT: {e}')
+    BOARD_WIDTH, BOARD_HEIGHT = width, height
+
+
+def bootstrap():
+    # open the window and load the fonts; importing this module does neither, so tools
+    # can use it without a display
+    read_board_size()
+    start = time.perf_counter()
+    pygame.display.init()
+    pygame.font.init()
+    win = pygame.display.set_mode((WIDTH, HEIGHT), pygame.SCALED if VSYNC else 0, vsync=int(VSYNC))
+    pygame.display.set_caption('TETRIS')
+    for name in FONTS:
+        get_font(name)
+    print(f'startup took {(time.perf_counter() - start) * 1000:.0f} ms')
+    return win
 
 
 def draw_name(win, player):
     draw = True
+    state = GAME_OVER
     while draw:
-        for event in pygame.event.get():
-            if event.type == pygame.KEYDOWN:
-                if event.unicode.isalpha():
-                    player.name += event.unicode
-                elif event.key == pygame.K_BACKSPACE:
-                    player.name = player.name[:-1]
-                elif event.key == pygame.K_RETURN or event.type == pygame.QUIT:
-                    draw = False
         win.fill(BACKGROUND_COLOR)
 
-        lost_text = TITLE_FONT.render('YOU LOST!', True, TEXT_COLOR)
+        lost_text = render_text(get_font('title'), 'YOU LOST!', TEXT_COLOR)
         win.blit(lost_text, (WIDTH / 2 - lost_text.get_width() / 2, HEIGHT / 10))
 
-        input_text = TITLE_FONT.render('Enter your name:', True, TEXT_COLOR)
+        input_text = render_text(get_font('title'), 'Enter your name:', TEXT_COLOR)
         win.blit(input_text, (WIDTH / 2 - input_text.get_width() / 2, HEIGHT / 4 + 50))
 
-        block = SCORE_FONT.render(player.name, True, TEXT_COLOR)
+        block = render_text(get_font('score'), player.name, TEXT_COLOR)
         rect = block.get_rect()
         rect.center = win.get_rect().center
         win.blit(block, rect)
         pygame.display.update()
 
+        for event in wait_events():
+            if event.type == pygame.QUIT:
+                draw = False
+                state = EXIT
+            elif event.type == pygame.KEYDOWN:
+                if event.unicode.isalpha():
+                    player.name += event.unicode
+                elif event.key == pygame.K_BACKSPACE:
+                    player.name = player.name[:-1]
+                elif event.key == pygame.K_RETURN:
+                    draw = False
+
     if player.score > 0:
-        player.save_score(player.format_timer)
+        player.save_score(player.format_timer, mode)
     player.restart_stats()
-    draw_lost_text(win, player)
+    return state
 
 
-def draw_lost_text(win, player):
+def draw_lost_text(win):
     global active
-    lost = True
 
-    while lost:
+    while True:
         win.fill(BACKGROUND_COLOR)
-        retry_text = TITLE_FONT.render('Do you want to play again?', True, TEXT_COLOR)
+        retry_text = render_text(get_font('title'), 'Do you want to play again?', TEXT_COLOR)
         win.blit(retry_text, (WIDTH / 2 - retry_text.get_width() / 2, HEIGHT / 5))
         retry_options = [('YES', 150), ('NO', - 150)]
         for i, v in enumerate(retry_options, start=1):
             if i == active:
-                label = TITLE_FONT.render(v[0], True, ACTIVE_COLOR)
+                label = render_text(get_font('title'), v[0], ACTIVE_COLOR)
             else:
-                label = TITLE_FONT.render(v[0], True, TEXT_COLOR)
+                label = render_text(get_font('title'), v[0], TEXT_COLOR)
             win.blit(label, (WIDTH / 2 - label.get_width() / 2 - v[1], HEIGHT / 3 + 100))
         pygame.display.update()
 
-        for event in pygame.event.get():
+        for event in wait_events():
             if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
+                return EXIT
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_RIGHT:
                     if active == 2:
@@ -227,161 +161,130 @@ def draw_lost_text(win, player):
                         active -= 1
                 elif event.key == pygame.K_RETURN:
                     if active == 1:
-                        main(win, player)
+                        return PLAYING
                     elif active == 2:
-                        pygame.quit()
-                        sys.exit()
-
-
-def clear_rows(grid, lock, player):
-    num_del = 0  # number of row to delete
-    for i in range(len(grid) - 1, -1, -1):
-        row = grid[i]
-        if BLOCK_COLOR not in row:
-            num_del += 1
-            ind = i  # index of row to delete
-            for j in range(len(row)):
-                try:
-                    del lock[(j, i)]
-                except:
-                    continue
-    if num_del > 0:
-        player.extra_speed += num_del
-        player.combo += num_del
-        player.max_combo = player.combo if player.combo > player.max_combo else player.max_combo
-        if mode == 1 and player.fall_speed > 0.1:
-            player.fall_speed -= player.extra_speed * 0.005
-            player.speed_level += player.extra_speed
-        for key in sorted(list(lock), key=lambda x: x[1])[::-1]:
-            x, y = key
-            if y < ind:
-                new_key = (x, y + num_del)
-                lock[new_key] = lock.pop(key)
-    else:
-        player.combo = 0
-
-    return num_del
-
-
-def main(win, player):
-    locked_pos = {}
-    grid = create_grid(locked_pos)
-    change_piece = False
-    current_piece = get_shape()
-    next_piece = get_shape()
+                        return EXIT
+
+
+def create_board(grid):
+    # wide boards always fit, even if the blocks get smaller than MIN_BLOCK_SIZE
+    block_size = min(MAX_BLOCK_SIZE, MAX_BOX_WIDTH // grid.width, max(MIN_BLOCK_SIZE, MAX_BOX_HEIGHT // grid.height))
+    visible_rows = min(grid.height, MAX_BOX_HEIGHT // block_size)
+    return Board(WIDTH, HEIGHT, block_size, grid.width * block_size, visible_rows * block_size)
+
+
+def draw_game(win, board, game):
+    player = game.player
+    PROFILER.begin('draw_window')
+    dirty = board.draw_window(win, game.grid, convert_shape_format(game.current_piece), game.current_piece.color,
+                              draw_grid, game.ghost_positions())
+    PROFILER.end('draw_window')
+    PROFILER.begin('draw_next_shape')
+    dirty += board.draw_next_shape(game.next_piece, win, player.score, player.get_max_score, player.format_timer,
+                                   player.speed_level, player.combo, player.max_combo)
+    PROFILER.end('draw_next_shape')
+    dirty += board.draw_profiler(win, PROFILER)
+    PROFILER.begin('display_update')
+    if dirty:
+        pygame.display.update(dirty)
+    PROFILER.end('display_update')
+    PROFILER.end_frame()
+
+
+def play_replay(win, replay, speed=1):
+    replay_player = ReplayPlayer(replay)
     clock = pygame.time.Clock()
-    fall_time = 0
-    hardcore_time = 0
-    time_elapsed = 0
-    board = Board(WIDTH, HEIGHT, BLOCK_SIZE, BOX_WIDTH, BOX_HEIGHT)
-
-    player.restart_stats()
-
-    run = True
-    while run:
-        grid = create_grid(locked_pos)
-        fall_time += clock.get_rawtime()
-        time_elapsed += clock.get_rawtime()
-        if mode == 2:
-            hardcore_time += clock.get_rawtime()
-        clock.tick()
-
-        if time_elapsed / 1000 > 1:
-            time_elapsed = 0
-            player.timer += 1
-
-        if hardcore_time / 1000 > 5:
-            hardcore_time = 0
-            if player.fall_speed > 0.1:
-                player.fall_speed -= 0.005
-                player.speed_level += 1
-
-        if fall_time / 1000 > player.fall_speed:
-            fall_time = 0
-            current_piece.y += 1
-            if not (valid_space(current_piece, grid, convert_shape_format)) and current_piece.y > 0:
-                current_piece.y -= 1
-                change_piece = True
+    board = create_board(replay_player.game.grid)
 
+    while not replay_player.finished:
+        clock.tick(FPS)
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+                return replay_player.game
+        replay_player.advance(clock.get_time(), speed)
+        draw_game(win, board, replay_player.game)
+    return replay_player.game
+
+
+# one game in progress and everything that lives exactly as long as it does
+class Session(object):
+    def __init__(self, player):
+        seed = random.getrandbits(64)
+        if SERVER:
+            self.game = RemoteGame(player, SERVER, mode, seed, BOARD_WIDTH, BOARD_HEIGHT)
+        else:
+            self.game = Game(player, mode, random.Random(seed), BOARD_WIDTH, BOARD_HEIGHT)
+            if REPLAY_DIR:
+                start_recording(self.game, REPLAY_DIR, seed, REPLAY_KEEP)
+        self.bot = Bot(workers=AUTOPLAY_WORKERS, executor='process', actions_per_frame=AUTOPLAY) if AUTOPLAY else None
+        self.clock = pygame.time.Clock()
+        self.board = create_board(self.game.grid)
+
+    def close(self):
+        if self.game.recorder:
+            self.game.recorder.close(self.game)
+            self.game.recorder = None
+        if self.bot:
+            self.bot.close()
+        if SERVER:
+            self.game.close()
+
+
+def main(win, session):
+    game = session.game
+    bot = session.bot
+    clock = session.clock
+    board = session.board
+    # coming back from the pause menu: repaint everything and do not count the time spent there
+    board.invalidate()
+    clock.tick()
+
+    while True:
+        clock.tick(FPS)
+
+        PROFILER.begin('events')
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
-                pygame.quit()
-                run = False
-                sys.exit()
+                return EXIT
 
             # Key handling
             if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_LEFT:
-                    current_piece.x -= 1
-                    if not (valid_space(current_piece, grid, convert_shape_format)):
-                        current_piece.x += 1
-                elif event.key == pygame.K_RIGHT:
-                    current_piece.x += 1
-                    if not (valid_space(current_piece, grid, convert_shape_format)):
-                        current_piece.x -= 1
-                elif event.key == pygame.K_DOWN:
-                    current_piece.y += 1
-                    if not (valid_space(current_piece, grid, convert_shape_format)):
-                        current_piece.y -= 1
-                elif event.key == pygame.K_UP:
-                    current_piece.rotation += 1
-                    if not (valid_space(current_piece, grid, convert_shape_format)):
-                        current_piece.rotation -= 1
-                elif event.key == pygame.K_RETURN:
-                    for i in range(20):
-                        current_piece.y += 1
-                        if not (valid_space(current_piece, grid, convert_shape_format)):
-                            current_piece.y -= 1
+                if event.key in KEY_ACTIONS:
+                    game.apply_action(KEY_ACTIONS[event.key])
+                elif event.key == pygame.K_F3:
+                    PROFILER.toggle()
                 elif event.key == pygame.K_ESCAPE:
-                    pause(win, active, WIDTH, HEIGHT, player.restart_stats, main, main_menu, get_leaderboard, player)
-
-        shape_pos = convert_shape_format(current_piece)
-
-        # draw square within the block
-        for i in range(len(shape_pos)):
-            x, y = shape_pos[i]
-            if y > -1:
-                grid[y][x] = current_piece.color
-
-        if change_piece:
-            for pos in shape_pos:
-                p = (pos[0], pos[1])
-                locked_pos[p] = current_piece.color
-            current_piece = next_piece
-            next_piece = get_shape()
-            change_piece = False
-            player.score += clear_rows(grid, locked_pos, player) * player.get_score_factor()
-
-        board.draw_window(win, grid, draw_grid)
-        board.draw_next_shape(next_piece, win, player.score, player.get_max_score, player.format_timer,
-                              player.speed_level, player.combo, player.max_combo)
-        pygame.display.update()
+                    return PAUSED
+
+        if bot:
+            for action in bot.get_actions(game):
+                game.apply_action(action)
+        PROFILER.end('events')
 
-        if check_lost(locked_pos):
-            draw_name(win, player)
+        PROFILER.begin('update')
+        game.advance(clock.get_time())
+        PROFILER.end('update')
+        draw_game(win, board, game)
 
-    pygame.display.quit()
+        if game.lost:
+            return NAME_ENTRY
 
 
-def main_menu(win):
+def main_menu(win, player):
     global active
     global mode
-    player = Player()
-    run = True
     speeds = ['LOW', 'MEDIUM', 'HIGH']
     modes = ['ENDLESS (CONSTANT SPEED)', 'SURVIVAL (INCREASING SPEED WHEN SCORING POINTS)',
              'HARDCORE (INCREASING SPEED OVER TIME)']
-    while run:
+    while True:
         win.fill(BACKGROUND_COLOR)
         buttons = ['NEW GAME', f'SPEED: {speeds[player.speed]}', f'MODE: {modes[mode]}', 'LEADERBOARD', 'EXIT']
         draw_menu(win, 'MAIN MENU', buttons, WIDTH, HEIGHT, active)
         pygame.display.update()
 
-        for event in pygame.event.get():
+        for event in wait_events():
             if event.type == pygame.QUIT:
-                pygame.quit()
-                run = False
-                sys.exit()
+                return EXIT
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_DOWN:
                     if active == 5:
@@ -395,34 +298,66 @@ def main_menu(win):
                         active -= 1
                 elif event.key == pygame.K_RETURN:
                     if active == 1:
-                        main(win, player)
+                        return PLAYING
                     elif active == 2:
                         if player.speed == 2:
                             player.speed = 0
-                            player.speed_level = 1
-                            player.start_speed_level = 1
-                            player.fall_speed = 0.45 - player.start_speed_level * 0.005
-                            player.start_fall_speed = 0.45 - player.start_speed_level * 0.005
+                            player.set_start_speed_level(1)
                         else:
                             player.speed += 1
-                            player.speed_level += 30
-                            player.start_speed_level += 30
-                            player.fall_speed = 0.45 - player.start_speed_level * 0.005
-                            player.start_fall_speed = 0.45 - player.start_speed_level * 0.005
+                            player.set_start_speed_level(player.start_speed_level + 30)
                     elif active == 3:
                         if mode == 2:
                             mode = 0
                         else:
                             mode += 1
                     elif active == 4:
-                        get_leaderboard(win, WIDTH, HEIGHT)
+                        return LEADERBOARD
                     elif active == 5:
-                        pygame.quit()
-                        sys.exit()
+                        return EXIT
 
+
+def run(win):
+    # every screen returns the next one instead of calling it, so the stack stays flat
+    # and a finished game is dropped as soon as it is left
+    # repair a score cut off by a crash before the menu reads the best one; only the game
+    # does this, the replay and network viewers share bootstrap() but never write scores
+    SCORE_WRITER.recover()
+    player = Player()
+    session = None
+    state = MENU
+    back = MENU
+    while state != EXIT:
+        if state == MENU:
+            back = MENU
+            state = main_menu(win, player)
+        elif state == PLAYING:
+            if session is None:
+                session = Session(player)
+            state = main(win, session)
+        elif state == PAUSED:
+            back = PAUSED
+            choice = pause(win, active, WIDTH, HEIGHT)
+            state = PAUSE_CHOICES[choice]
+            if choice in ('RESTART', 'MAIN MENU'):
+                session.close()
+                session = None
+        elif state == NAME_ENTRY:
+            session.close()
+            session = None
+            state = draw_name(win, player)
+        elif state == GAME_OVER:
+            state = draw_lost_text(win)
+        elif state == LEADERBOARD:
+            get_leaderboard(win, WIDTH, HEIGHT)
+            state = back
+
+    if session is not None:
+        session.close()
+    # wait for the scores still on their way to the disk
+    SCORE_WRITER.close()
     pygame.quit()
-    sys.exit()
 
 
 if __name__ == '__main__':
-    main_menu(WIN)
+    run(bootstrap())
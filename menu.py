@@ -1,12 +1,15 @@
 import pygame
-import sys
-from board import TITLE_FONT, SCORE_FONT, BACKGROUND_COLOR, TEXT_COLOR
-
-pygame.font.init()
+from board import get_font, BACKGROUND_COLOR, TEXT_COLOR
+from textcache import render_text
 
 ACTIVE_COLOR = (234, 113, 134)
 
 
+def wait_events():
+    # sleep until something happens instead of redrawing a static screen in a busy loop
+    return [pygame.event.wait()] + pygame.event.get()
+
+
 def draw_menu_button(win, text, row, color, width, height):
     rows_height = {
         1: 150,
@@ -16,13 +19,13 @@ def draw_menu_button(win, text, row, color, width, height):
         5: -50
     }
 
-    label = SCORE_FONT.render(text, True, color)
+    label = render_text(get_font('score'), text, color)
     button_x = width / 2 - label.get_width() / 2
     win.blit(label, (button_x, height / 2 - rows_height[row]))
 
 
 def draw_menu(win, menu_title, buttons, width, height, active):
-    menu_text = TITLE_FONT.render(menu_title, True, TEXT_COLOR)
+    menu_text = render_text(get_font('title'), menu_title, TEXT_COLOR)
     win.blit(menu_text, (width / 2 - menu_text.get_width() / 2, height / 2 - 250))
 
     for i, v in enumerate(buttons, start=1):
@@ -32,22 +35,21 @@ def draw_menu(win, menu_title, buttons, width, height, active):
             draw_menu_button(win, v, i, TEXT_COLOR, width, height)
 
 
-def pause(win, active, width, height, restart, main, main_menu, get_leaderboard, player):
+def pause(win, active, width, height):
+    # returns the chosen button, the caller decides where to go from there
     buttons = ['RESUME', 'RESTART', 'MAIN MENU', 'HIGH SCORES', 'EXIT']
-    paused = True
 
-    while paused:
+    while True:
         win.fill(BACKGROUND_COLOR)
         draw_menu(win, 'PAUSE', buttons, width, height, active)
         pygame.display.update()
 
-        for event in pygame.event.get():
+        for event in wait_events():
             if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
+                return 'EXIT'
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE:
-                    paused = False
+                    return 'RESUME'
                 elif event.key == pygame.K_DOWN:
                     if active == 5:
                         active = 1
@@ -59,15 +61,4 @@ def pause(win, active, width, height, restart, main, main_menu, get_leaderboard,
                     else:
                         active -= 1
                 elif event.key == pygame.K_RETURN:
-                    if active == 1:
-                        paused = False
-                    elif active == 2:
-                        restart()
-                        main(win, player)
-                    elif active == 3:
-                        main_menu(win)
-                    elif active == 4:
-                        get_leaderboard(win, width, height)
-                    elif active == 5:
-                        pygame.quit()
-                        sys.exit()
\ No newline at end of file
+                    return buttons[active - 1]
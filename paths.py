@@ -0,0 +1,5 @@
+import os
+
+# fonts and data files live next to the code, so the game runs from any directory
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FONTS_DIR = os.path.join(BASE_DIR, 'fonts')
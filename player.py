@@ -1,5 +1,6 @@
-import csv
 from datetime import date
+from scores import SCORES
+from scorewriter import SCORE_WRITER
 
 
 class Player(object):
@@ -18,15 +19,7 @@ class Player(object):
 
     @staticmethod
     def get_max_score():
-        rows = []
-        with open('scores.csv', 'a+') as f:
-            f.seek(0)
-            reader = csv.reader(f, delimiter=',')
-            for row in reader:
-                rows.append(int(row[1]))
-        if len(rows) > 0:
-            max_score = sorted(rows, reverse=True)
-            return max_score[0]
+        return SCORES.get_max_score()
 
     def format_timer(self):
         mins = self.timer // 60
@@ -37,13 +30,17 @@ class Player(object):
 
         return formatted_timer
 
-    def save_score(self, formatted_timer):
-        with open('scores.csv', 'a+') as f:
-            f.seek(0)
-            data = f.read(100)
-            if len(data) > 0:
-                f.write('\n')
-            f.write(f'{self.name},{str(self.score)},{self.speed_level},{formatted_timer()},{self.max_combo},{date.today()}')
+    def save_score(self, formatted_timer, mode=None):
+        record = (self.name, self.score, self.speed_level, formatted_timer(), self.max_combo, str(date.today()), mode)
+        # shown right away, written to the file in the background
+        SCORES.add(record)
+        SCORE_WRITER.submit(record)
+
+    def set_start_speed_level(self, level):
+        self.speed_level = level
+        self.start_speed_level = level
+        self.fall_speed = 0.45 - level * 0.005
+        self.start_fall_speed = 0.45 - level * 0.005
 
     def get_score_factor(self):
         score_factor = self.speed_level + self.combo * 10
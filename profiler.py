@@ -0,0 +1,86 @@
+import atexit
+import csv
+import os
+import time
+from collections import deque
+
+PHASES = ('events', 'update', 'clear_rows', 'draw_window', 'draw_next_shape', 'display_update')
+
+
+def percentiles(values):
+    # p50, p95 and p99 of sorted values, nearest rank
+    if not values:
+        return 0, 0, 0
+    last = len(values) - 1
+    return tuple(values[round(last * q)] for q in (0.5, 0.95, 0.99))
+
+
+# opt-in timing of the phases of a frame; while disabled every call returns right
+# away, so the calls can stay in the game loop
+class FrameProfiler(object):
+    def __init__(self, enabled=False, window=300, csv_path=None):
+        self.enabled = enabled or bool(csv_path)
+        self.window = window
+        self.csv_path = csv_path
+        self.samples = {phase: deque(maxlen=window) for phase in PHASES + ('total',)}
+        self.frames = 0
+        self._frame = {}
+        self._starts = {}
+        self._frame_start = None
+        self._csv_file = None
+        self._csv = None
+
+    def begin(self, phase):
+        if self.enabled:
+            self._starts[phase] = time.perf_counter()
+
+    def end(self, phase):
+        if self.enabled:
+            start = self._starts.pop(phase, None)
+            if start is not None:
+                self._frame[phase] = self._frame.get(phase, 0) + time.perf_counter() - start
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if self._frame_start is not None:
+            frame = self._frame
+            frame['total'] = now - self._frame_start
+            for phase, samples in self.samples.items():
+                samples.append(frame.get(phase, 0))
+            self.frames += 1
+            if self.csv_path:
+                self._write_row(frame)
+        self._frame = {}
+        self._frame_start = now
+
+    def _write_row(self, frame):
+        if self._csv is None:
+            self._csv_file = open(self.csv_path, 'w', newline='')
+            self._csv = csv.writer(self._csv_file)
+            self._csv.writerow(('frame',) + PHASES + ('total',))
+            atexit.register(self.close)
+        self._csv.writerow([self.frames] + [f'{frame.get(phase, 0) * 1000:.4f}' for phase in PHASES + ('total',)])
+
+    def percentiles(self, phase):
+        return percentiles(sorted(self.samples[phase]))
+
+    def report(self):
+        # milliseconds per phase as (p50, p95, p99)
+        return {phase: tuple(value * 1000 for value in self.percentiles(phase)) for phase in self.samples}
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self._frame = {}
+        self._starts = {}
+        self._frame_start = None
+
+    def close(self):
+        if self._csv_file is not None:
+            self._csv_file.close()
+            self._csv_file = None
+            self._csv = None
+
+
+PROFILER = FrameProfiler(os.environ.get('TETRIS_PROFILE') == '1', csv_path=os.environ.get('TETRIS_PROFILE_CSV'))
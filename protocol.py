@@ -0,0 +1,86 @@
+import json
+import struct
+from shapes import COLOR_CODES, CODE_COLORS, ROTATIONS
+
+# every message is a frame header (payload length, message type) and the payload
+FRAME = struct.Struct('<IB')
+
+# client to server
+NEW, INPUT, WATCH, STATS = 1, 2, 3, 4
+# seed, start speed level, mode, width, height
+NEW_GAME = struct.Struct('<QBBHH')
+SESSION_ID = struct.Struct('<I')
+
+# server to client
+STATE, STATS_REPLY = 1, 2
+# session id, tick, flags, width, height, pieces played, piece index, rotation, x, y, next index,
+# score, lines, speed level, combo, max combo, timer and the number of rows that follow
+STATE_HEADER = struct.Struct('<IIBHHIBBhhBIIHHHIH')
+ROW_INDEX = struct.Struct('<H')
+FULL, LOST = 1, 2
+
+
+def encode_frame(kind, payload=b''):
+    return FRAME.pack(len(payload), kind) + payload
+
+
+def encode_row(colors):
+    return bytes(COLOR_CODES[color] if color is not None else 0 for color in colors)
+
+
+def decode_row(data):
+    return [CODE_COLORS[code] for code in data]
+
+
+def state_fields(game):
+    # everything about a game besides the locked cells that a client shows
+    piece = game.current_piece
+    player = game.player
+    return (game.pieces, piece.index, piece.rotation % len(ROTATIONS[piece.index]), piece.x, piece.y,
+            game.next_piece.index, player.score, game.lines, player.speed_level, player.combo, player.max_combo, player.timer)
+
+
+def encode_state(session_id, game, rows, full=False):
+    # rows is a list of (y, colors) for the rows that changed since the last message
+    flags = (FULL if full else 0) | (LOST if game.lost else 0)
+    parts = [STATE_HEADER.pack(session_id, game.ticks, flags, game.grid.width, game.grid.height,
+                               *state_fields(game), len(rows))]
+    for y, colors in rows:
+        parts.append(ROW_INDEX.pack(y))
+        parts.append(encode_row(colors))
+    return encode_frame(STATE, b''.join(parts))
+
+
+def decode_state(payload):
+    fields = STATE_HEADER.unpack_from(payload)
+    session_id, tick, flags, width, height = fields[:5]
+    state = {
+        'session_id': session_id,
+        'tick': tick,
+        'full': bool(flags & FULL),
+        'lost': bool(flags & LOST),
+        'width': width,
+        'height': height,
+        'pieces': fields[5],
+        'piece': fields[6:10],
+        'next': fields[10],
+        'score': fields[11],
+        'lines': fields[12],
+        'speed_level': fields[13],
+        'combo': fields[14],
+        'max_combo': fields[15],
+        'timer': fields[16],
+    }
+    rows = {}
+    pos = STATE_HEADER.size
+    for _ in range(fields[17]):
+        y, = ROW_INDEX.unpack_from(payload, pos)
+        pos += ROW_INDEX.size
+        rows[y] = decode_row(payload[pos:pos + width])
+        pos += width
+    state['rows'] = rows
+    return state
+
+
+def encode_stats(stats):
+    return encode_frame(STATS_REPLY, json.dumps(stats).encode())
@@ -0,0 +1,244 @@
+import argparse
+import os
+import queue
+import random
+import struct
+import threading
+from game import Game, STEP_TIME
+from player import Player
+
+# file layout: header, board size, the starting combo, extra speed and score as varints, then
+# one varint per input holding (ticks since the previous input << 3 | action), then END with
+# the final tick count, score and lines as varints
+MAGIC = b'TRPL'
+VERSION = 3
+HEADER = struct.Struct('<4sBQHB')
+SIZE = struct.Struct('<HH')
+# versions 1 and 2 kept the player state in the header, in fields the totals of a long running
+# cabinet outgrow; version 2 adds the board size after it, version 1 files are 10x20
+OLD_HEADER = struct.Struct('<4sBQHBHHI')
+END = 7
+# recordings kept in the replay folder, the oldest ones are removed beyond this
+MAX_REPLAYS = 100
+
+
+def write_varint(buffer, value):
+    while value > 0x7f:
+        buffer.append(value & 0x7f | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def read_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+# records the inputs of one game; the bytes are handed to a writer thread so the game
+# loop never waits on the disk. The header goes out right away and the inputs every time
+# a piece locks, so a crash loses at most the inputs of the piece in play.
+class ReplayRecorder(object):
+    def __init__(self, path, seed, player, mode, width=10, height=20, chunk_size=4096):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.last_tick = 0
+        self.buffer = bytearray(HEADER.pack(MAGIC, VERSION, seed, player.start_speed_level, mode))
+        self.buffer += SIZE.pack(width, height)
+        for value in (player.combo, player.extra_speed, player.score):
+            write_varint(self.buffer, value)
+        self.start_score = player.score
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._write, daemon=True)
+        self._thread.start()
+        self.flush()
+
+    def _write(self):
+        with open(self.path, 'wb') as f:
+            while True:
+                chunk = self._queue.get()
+                if chunk is None:
+                    break
+                f.write(chunk)
+                f.flush()
+
+    def flush(self):
+        if self.buffer:
+            self._queue.put(bytes(self.buffer))
+            self.buffer.clear()
+
+    def record(self, tick, action):
+        write_varint(self.buffer, (tick - self.last_tick) << 3 | action)
+        self.last_tick = tick
+        if len(self.buffer) >= self.chunk_size:
+            self.flush()
+
+    def close(self, game):
+        write_varint(self.buffer, END)
+        write_varint(self.buffer, game.ticks)
+        write_varint(self.buffer, game.player.score - self.start_score)
+        write_varint(self.buffer, game.lines)
+        self.flush()
+        self._queue.put(None)
+        self._thread.join()
+
+
+def prune_replays(directory, keep=MAX_REPLAYS):
+    # removes the oldest recordings so that at most keep are left
+    paths = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.trpl')]
+    if len(paths) <= keep:
+        return 0
+    paths.sort(key=os.path.getmtime)
+    for path in paths[:len(paths) - keep]:
+        os.remove(path)
+    return len(paths) - keep
+
+
+def start_recording(game, directory, seed, keep=MAX_REPLAYS):
+    os.makedirs(directory, exist_ok=True)
+    # room for the new one
+    prune_replays(directory, max(0, keep - 1))
+    name = f'{seed:016x}.trpl'
+    game.recorder = ReplayRecorder(os.path.join(directory, name), seed, game.player, game.mode,
+                                   game.grid.width, game.grid.height)
+    return game.recorder
+
+
+class Replay(object):
+    def __init__(self, data):
+        if len(data) < HEADER.size:
+            raise ValueError('not a replay file, or one cut off before its header')
+        magic, version, self.seed, self.speed_level, self.mode = HEADER.unpack_from(data)
+        if magic != MAGIC or version not in (1, 2, VERSION):
+            raise ValueError('not a replay file')
+        pos = HEADER.size
+        if version < 3:
+            if len(data) < OLD_HEADER.size:
+                raise ValueError('not a replay file, or one cut off before its header')
+            self.combo, self.extra_speed, self.start_score = OLD_HEADER.unpack_from(data)[5:]
+            pos = OLD_HEADER.size
+        self.width, self.height = 10, 20
+        if version > 1:
+            if len(data) < pos + SIZE.size:
+                raise ValueError('replay file cut off before its board size')
+            self.width, self.height = SIZE.unpack_from(data, pos)
+            pos += SIZE.size
+        if version > 2:
+            try:
+                self.combo, pos = read_varint(data, pos)
+                self.extra_speed, pos = read_varint(data, pos)
+                self.start_score, pos = read_varint(data, pos)
+            except IndexError:
+                raise ValueError('replay file cut off before its player state')
+
+        self.events = []
+        self.final = None
+        tick = 0
+        try:
+            while pos < len(data):
+                value, pos = read_varint(data, pos)
+                if value == END:
+                    ticks, pos = read_varint(data, pos)
+                    score, pos = read_varint(data, pos)
+                    lines, pos = read_varint(data, pos)
+                    self.final = {'ticks': ticks, 'score': score, 'lines': lines}
+                    break
+                tick += value >> 3
+                self.events.append((tick, value & 7))
+        except IndexError:
+            # the recording was cut off, keep the inputs read so far
+            pass
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls(f.read())
+
+    def new_game(self):
+        player = Player()
+        player.set_start_speed_level(self.speed_level)
+        player.combo = self.combo
+        player.extra_speed = self.extra_speed
+        player.score = self.start_score
+        return Game(player, self.mode, random.Random(self.seed), self.width, self.height)
+
+
+# feeds the recorded inputs back into a fresh game, tick by tick
+class ReplayPlayer(object):
+    def __init__(self, replay):
+        self.replay = replay
+        self.game = replay.new_game()
+        self.index = 0
+
+    @property
+    def finished(self):
+        game = self.game
+        final = self.replay.final
+        return game.lost or (final is not None and game.ticks >= final['ticks'])
+
+    def run_ticks(self, count):
+        game = self.game
+        events = self.replay.events
+        for _ in range(count):
+            if self.finished:
+                break
+            while self.index < len(events) and events[self.index][0] <= game.ticks:
+                game.apply_action(events[self.index][1])
+                self.index += 1
+            game.tick()
+
+    def run(self):
+        while not self.finished:
+            self.run_ticks(1000)
+        return self.game
+
+    def advance(self, dt, speed=1):
+        # visual playback, dt in milliseconds scaled by the speed multiplier
+        self.game.accumulator += dt * speed
+        count = int(self.game.accumulator // STEP_TIME)
+        self.game.accumulator -= count * STEP_TIME
+        self.run_ticks(count)
+
+
+def verify(path):
+    replay = Replay.load(path)
+    game = ReplayPlayer(replay).run()
+    result = {'ticks': game.ticks, 'score': game.player.score - replay.start_score, 'lines': game.lines}
+    return result, replay.final
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Verify or watch recorded games.')
+    parser.add_argument('command', choices=['verify', 'play'])
+    parser.add_argument('path')
+    parser.add_argument('--speed', type=float, default=1, help='playback speed multiplier')
+    args = parser.parse_args()
+
+    if args.command == 'verify':
+        try:
+            result, final = verify(args.path)
+        except ValueError as e:
+            print(e)
+            raise SystemExit(1)
+        print(f'replayed: {result}')
+        print(f'recorded: {final}')
+        if final is None:
+            print('recording has no final state')
+            raise SystemExit(1)
+        if result != final:
+            print('MISMATCH')
+            raise SystemExit(1)
+        print('OK')
+    else:
+        from main import bootstrap, play_replay
+        play_replay(bootstrap(), Replay.load(args.path), args.speed)
+
+
+if __name__ == '__main__':
+    main()
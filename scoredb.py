@@ -0,0 +1,152 @@
+import argparse
+import csv
+import os
+import sqlite3
+from paths import BASE_DIR
+from scores import SCORES_FILE, parse_row, format_row
+
+SCORES_DB = os.path.join(BASE_DIR, 'scores.db')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS scores (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    speed_level INTEGER NOT NULL,
+    time TEXT NOT NULL,
+    max_combo INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    mode INTEGER
+);
+CREATE INDEX IF NOT EXISTS scores_by_score ON scores (score DESC, id);
+CREATE INDEX IF NOT EXISTS scores_by_speed ON scores (speed_level, score DESC, id);
+CREATE INDEX IF NOT EXISTS scores_by_mode ON scores (mode, score DESC, id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+'''
+
+
+# sqlite index over the append-only scores.csv: every sync reads only the bytes
+# appended since the last one and stores the new rows together with the file
+# offset in a single transaction, so a crash never indexes a row twice or loses one
+class ScoreIndex(object):
+    def __init__(self, db_path=SCORES_DB, csv_path=SCORES_FILE):
+        self.db_path = db_path
+        self.csv_path = csv_path
+        self.skipped = 0
+        self._db = None
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.db_path)
+            self._db.executescript(SCHEMA)
+        return self._db
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _get_meta(self, key, default=0):
+        row = self.db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key, value):
+        self.db.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    def sync(self):
+        try:
+            size = os.path.getsize(self.csv_path)
+        except FileNotFoundError:
+            return 0
+        offset = self._get_meta('csv_offset')
+        if size == offset:
+            return 0
+
+        with self.db:
+            if size < offset:
+                # the csv was replaced or truncated, index it from scratch
+                self.db.execute('DELETE FROM scores')
+                offset = 0
+
+            with open(self.csv_path, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+
+            records = []
+            end = offset
+            for line in data.splitlines(keepends=True):
+                if not line.endswith(b'\n'):
+                    # a record still being written or cut off by a crash, which recover() either ends
+                    # or cuts off; it is picked up on a later sync once it has its newline
+                    break
+                row = next(csv.reader([line.decode('utf-8', 'replace')]), None)
+                if not row:
+                    end += len(line)
+                    continue
+                record = parse_row(row)
+                if record is None:
+                    self.skipped += 1
+                else:
+                    records.append(record)
+                end += len(line)
+
+            self.db.executemany('INSERT INTO scores (name, score, speed_level, time, max_combo, date, mode) '
+                                'VALUES (?, ?, ?, ?, ?, ?, ?)', records)
+            self._set_meta('csv_offset', end)
+        return len(records)
+
+    def rebuild(self):
+        with self.db:
+            self.db.execute('DELETE FROM scores')
+            self._set_meta('csv_offset', 0)
+        return self.sync()
+
+    def top(self, k=10, speed_level=None, mode=None):
+        self.sync()
+        query = 'SELECT name, score, speed_level, time, max_combo, date, mode FROM scores'
+        conditions = []
+        params = []
+        if speed_level is not None:
+            conditions.append('speed_level = ?')
+            params.append(speed_level)
+        if mode is not None:
+            conditions.append('mode = ?')
+            params.append(mode)
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY score DESC, id LIMIT ?'
+        params.append(k)
+        return self.db.execute(query, params).fetchall()
+
+    def count(self):
+        self.sync()
+        return self.db.execute('SELECT COUNT(*) FROM scores').fetchone()[0]
+
+
+SCORE_INDEX = ScoreIndex()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or query the leaderboard index of scores.csv.')
+    parser.add_argument('--csv', default=SCORES_FILE)
+    parser.add_argument('--db', default=SCORES_DB)
+    parser.add_argument('--rebuild', action='store_true', help='drop the index and read the whole csv again')
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--speed-level', type=int)
+    parser.add_argument('--mode', type=int)
+    args = parser.parse_args()
+
+    index = ScoreIndex(args.db, args.csv)
+    added = index.rebuild() if args.rebuild else index.sync()
+    print(f'indexed {added} new rows, {index.count()} total, skipped {index.skipped} malformed')
+    for row in index.top(args.top, args.speed_level, args.mode):
+        print(format_row(row))
+    index.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+import csv
+import heapq
+import os
+import threading
+import time
+import zlib
+from datetime import date
+from paths import BASE_DIR
+
+SCORES_FILE = os.path.join(BASE_DIR, 'scores.csv')
+
+
+def checksum(text):
+    return f'{zlib.crc32(text.encode()):08x}'
+
+
+def parse_row(row):
+    # name, score, speed level, time, max combo, date, the game mode, which older
+    # files do not have, and a checksum of the other fields, which newer records end with
+    if len(row) > 7 and row[7] != checksum(','.join(row[:7])):
+        return None
+    try:
+        mode = int(row[6]) if len(row) > 6 and row[6] else None
+        return row[0], int(row[1]), int(row[2]), row[3], int(row[4]), row[5], mode
+    except (IndexError, ValueError):
+        return None
+
+
+def format_row(record):
+    return ','.join('' if field is None else str(field) for field in record)
+
+
+def format_line(record):
+    # a record as it is appended to scores.csv, the checksum marks it as written out in full
+    row = format_row(record)
+    return f'{row},{checksum(row)}\n'
+
+
+def split_line(line):
+    return line.decode('utf-8', 'replace').rstrip('\r').split(',')
+
+
+def is_complete(line, previous=None):
+    # a line without its newline is either the open last record of an old file or a write
+    # cut off by a crash. Newer records end with a checksum, a torn one lacks it or fails it.
+    row = split_line(line)
+    if len(row) > 7:
+        return parse_row(row) is not None
+    # the first version of the game wrote six fields and left the last line open, that is
+    # still guessed at when the line before is such a record too or there is none; the
+    # writer puts an empty line in front of its first record, so a record of a newer file
+    # cut right after the date is never taken for one
+    if len(row) != 6 or previous is not None and len(split_line(previous)) != 6:
+        return False
+    record = parse_row(row)
+    if record is None:
+        return False
+    try:
+        date.fromisoformat(record[5])
+    except ValueError:
+        return False
+    return True
+
+
+# keeps the best scores of scores.csv in memory; the file is read once and only
+# read again when its size or modification time changes on disk. New scores go in
+# with add() right away and reach the file later through the score writer.
+class ScoreRepository(object):
+    def __init__(self, path=SCORES_FILE, top_k=10, check_interval=1.0):
+        self.path = path
+        self.top_k = top_k
+        self.check_interval = check_interval
+        self.max_score = None
+        self.count = 0
+        self.skipped = 0
+        self._top = []
+        self._stamp = None
+        self._loaded = False
+        self._checked_at = 0
+        # the score writer reports its writes from its own thread
+        self._lock = threading.Lock()
+
+    def _get_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def load(self):
+        with self._lock:
+            self._load()
+
+    def _load(self):
+        self.max_score = None
+        self.count = 0
+        self.skipped = 0
+        self._top = []
+        self._stamp = self._get_stamp()
+        self._loaded = True
+        if self._stamp is None:
+            return
+        with open(self.path, newline='') as f:
+            for row in csv.reader(f, delimiter=','):
+                if not row:
+                    continue
+                record = parse_row(row)
+                if record is None:
+                    self.skipped += 1
+                else:
+                    self._insert(record)
+
+    def refresh(self):
+        if not self._loaded:
+            self.load()
+            return
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        if self._get_stamp() != self._stamp:
+            self.load()
+
+    def _insert(self, record):
+        score = record[1]
+        self.count += 1
+        if self.max_score is None or score > self.max_score:
+            self.max_score = score
+        # min-heap of the best scores, the counter keeps equal scores in insertion order
+        entry = (score, -self.count, record)
+        if len(self._top) < self.top_k:
+            heapq.heappush(self._top, entry)
+        elif entry > self._top[0]:
+            heapq.heapreplace(self._top, entry)
+
+    def add(self, record):
+        self.refresh()
+        self._insert(record)
+
+    def written(self, before, after):
+        # our own append, already added, so the new file stamp does not trigger a reload;
+        # when somebody else changed the file in between the stamps differ and it reloads
+        with self._lock:
+            if self._stamp == before:
+                self._stamp = after
+
+    def get_max_score(self):
+        self.refresh()
+        return self.max_score
+
+    def get_top(self):
+        self.refresh()
+        return [record for score, order, record in sorted(self._top, reverse=True)]
+
+
+SCORES = ScoreRepository()
@@ -0,0 +1,253 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import Counter
+from datetime import date
+from multiprocessing import Pool
+from scores import SCORES_FILE, parse_row, is_complete
+
+PERCENTILES = (0.5, 0.9, 0.99)
+# scores below this are counted exactly, larger ones are rounded down to this many significant digits
+EXACT_BELOW = 1000
+SIGNIFICANT_DIGITS = 3
+
+
+def bucket(value):
+    if value < EXACT_BELOW:
+        return value
+    scale = 10 ** (len(str(value)) - SIGNIFICANT_DIGITS)
+    return value // scale * scale
+
+
+# counts of rounded values, so it stays small for any number of rows and two of them
+# can be added up; percentiles are off by less than one unit in the third digit
+class Histogram(object):
+    def __init__(self):
+        self.counts = Counter()
+        self.count = 0
+        self.total = 0
+        self.max = None
+
+    def add(self, value):
+        self.counts[bucket(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+        self.count += other.count
+        self.total += other.total
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def percentiles(self, qs=PERCENTILES):
+        # nearest rank on the buckets, in ascending order of q
+        result = []
+        values = sorted(self.counts.items())
+        i = 0
+        seen = 0
+        for q in qs:
+            rank = max(1, round(q * self.count))
+            while seen + values[i][1] < rank:
+                seen += values[i][1]
+                i += 1
+            result.append(values[i][0])
+        return result
+
+    def summary(self):
+        if not self.count:
+            return {'games': 0}
+        result = {'games': self.count, 'mean': self.total / self.count}
+        for q, value in zip(PERCENTILES, self.percentiles()):
+            result[f'p{round(q * 100)}'] = value
+        result['max'] = self.max
+        return result
+
+
+def parse_time(value):
+    # MM:SS as written by Player.format_timer, the minutes can have more than two digits
+    minutes, seconds = value.split(':')
+    minutes, seconds = int(minutes), int(seconds)
+    if minutes < 0 or not 0 <= seconds < 60:
+        raise ValueError(value)
+    return minutes * 60 + seconds
+
+
+# everything the report needs from any number of rows; memory grows with the number of
+# distinct speed levels, combos and days, never with the rows
+class ScoreStats(object):
+    def __init__(self):
+        self.files = 0
+        self.rows = 0
+        self.malformed = 0
+        # the overall score histogram is the sum of these
+        self.speed_levels = {}
+        self.max_combos = Counter()
+        self.seconds = 0
+        # date -> [games, score sum, best score, seconds]
+        self.days = {}
+
+    def add_row(self, row):
+        record = parse_row(row)
+        if record is None:
+            self.malformed += 1
+            return
+        name, score, speed_level, timer, max_combo, day, mode = record
+        try:
+            seconds = parse_time(timer)
+            if day not in self.days:
+                date.fromisoformat(day)
+                self.days[day] = [0, 0, score, 0]
+        except ValueError:
+            self.malformed += 1
+            return
+        self.rows += 1
+        if speed_level not in self.speed_levels:
+            self.speed_levels[speed_level] = Histogram()
+        self.speed_levels[speed_level].add(score)
+        self.max_combos[max_combo] += 1
+        self.seconds += seconds
+        stats = self.days[day]
+        stats[0] += 1
+        stats[1] += score
+        stats[2] = max(stats[2], score)
+        stats[3] += seconds
+
+    def finished_lines(self, f):
+        # a last line without its newline is a record still being written or cut off by a crash; it
+        # only counts when it is the open last record the first version of the game left behind
+        previous = None
+        for line in f:
+            if not line.endswith('\n') and not is_complete(line.encode(), previous):
+                self.malformed += 1
+                continue
+            previous = line.rstrip('\r\n').encode()
+            yield line
+
+    def add_file(self, path):
+        self.files += 1
+        with open(path, newline='', encoding='utf-8', errors='replace') as f:
+            reader = csv.reader(self.finished_lines(f))
+            while True:
+                try:
+                    for row in reader:
+                        if row:
+                            self.add_row(row)
+                    break
+                except csv.Error:
+                    # e.g. a NUL byte left by a power cut, the reader goes on with the next line
+                    self.malformed += 1
+
+    def merge(self, other):
+        self.files += other.files
+        self.rows += other.rows
+        self.malformed += other.malformed
+        for speed_level, histogram in other.speed_levels.items():
+            self.speed_levels.setdefault(speed_level, Histogram()).merge(histogram)
+        self.max_combos.update(other.max_combos)
+        self.seconds += other.seconds
+        for day, (games, total, best, seconds) in other.days.items():
+            if day in self.days:
+                stats = self.days[day]
+                stats[0] += games
+                stats[1] += total
+                stats[2] = max(stats[2], best)
+                stats[3] += seconds
+            else:
+                self.days[day] = [games, total, best, seconds]
+
+    def summary(self):
+        scores = Histogram()
+        for histogram in self.speed_levels.values():
+            scores.merge(histogram)
+        return {
+            'files': self.files,
+            'rows': self.rows,
+            'malformed': self.malformed,
+            'score': scores.summary(),
+            'score_by_speed_level': {speed_level: self.speed_levels[speed_level].summary()
+                                     for speed_level in sorted(self.speed_levels)},
+            'max_combo': dict(sorted(self.max_combos.items())),
+            'game_time': {'games': self.rows, 'mean_seconds': self.seconds / self.rows if self.rows else 0},
+            'daily': {day: {'games': games, 'mean_score': total / games, 'max_score': best,
+                            'mean_seconds': seconds / games}
+                      for day, (games, total, best, seconds) in sorted(self.days.items())},
+        }
+
+
+def read_file(path):
+    stats = ScoreStats()
+    stats.add_file(path)
+    return stats
+
+
+def collect(paths, workers=1):
+    # one file per task, the workers send back only the small ScoreStats
+    total = ScoreStats()
+    if workers == 1 or len(paths) == 1:
+        for path in paths:
+            total.add_file(path)
+    else:
+        with Pool(min(workers, len(paths))) as pool:
+            for stats in pool.imap_unordered(read_file, paths):
+                total.merge(stats)
+    return total
+
+
+def write_csv(summary, f):
+    # one value per line as section, key, field, value
+    writer = csv.writer(f, lineterminator='\n')
+    writer.writerow(['section', 'key', 'field', 'value'])
+    for field in ('files', 'rows', 'malformed'):
+        writer.writerow(['total', '', field, summary[field]])
+    for field, value in summary['score'].items():
+        writer.writerow(['score', '', field, value])
+    for speed_level, stats in summary['score_by_speed_level'].items():
+        for field, value in stats.items():
+            writer.writerow(['score_by_speed_level', speed_level, field, value])
+    for max_combo, games in summary['max_combo'].items():
+        writer.writerow(['max_combo', max_combo, 'games', games])
+    writer.writerow(['game_time', '', 'mean_seconds', summary['game_time']['mean_seconds']])
+    for day, stats in summary['daily'].items():
+        for field, value in stats.items():
+            writer.writerow(['daily', day, field, value])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize any number of scores.csv files: score percentiles per '
+                                                 'speed level, max combos, game times and daily trends.')
+    parser.add_argument('paths', nargs='*', default=[SCORES_FILE], help=f'score files (default: {SCORES_FILE})')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='processes to read the files with (default: all cores)')
+    parser.add_argument('--format', choices=['json', 'csv'], default='json')
+    parser.add_argument('-o', '--output', help='write the summary to this file instead of stdout')
+    args = parser.parse_args()
+    missing = [path for path in args.paths if not os.path.isfile(path)]
+    if missing:
+        parser.error(f'no such file: {", ".join(missing)}')
+
+    start = time.perf_counter()
+    stats = collect(args.paths, args.workers or os.cpu_count() or 1)
+    summary = stats.summary()
+    print(f'read {stats.rows} rows from {stats.files} files in {time.perf_counter() - start:.1f}s, '
+          f'skipped {stats.malformed} malformed', file=sys.stderr)
+
+    f = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        if args.format == 'json':
+            json.dump(summary, f, indent=2)
+            f.write('\n')
+        else:
+            write_csv(summary, f)
+    finally:
+        if args.output:
+            f.close()
+
+
+if __name__ == '__main__':
+    main()
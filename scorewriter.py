@@ -0,0 +1,192 @@
+import atexit
+import os
+import queue
+import sys
+import threading
+import time
+from scores import SCORES, SCORES_FILE, format_line, is_complete, split_line
+
+# records wait in a bounded queue; a full queue makes submit() wait instead of dropping a score
+MAX_QUEUE = 256
+# after the first record of a batch the writer waits this long for more, then writes and syncs once
+BATCH_INTERVAL = 0.2
+RETRY_INTERVAL = 1.0
+
+_STOP = object()
+
+
+def read_tail(f, size):
+    # the last two lines of the file, the one before the last is None when there is only one
+    # line; records are short, the newlines are close to the end unless the tail is garbage
+    start = size
+    tail = b''
+    while start > 0:
+        start = max(0, start - 4096)
+        f.seek(start)
+        tail = f.read(size - start)
+        if tail.count(b'\n') >= 2:
+            break
+    lines = tail.split(b'\n')
+    previous = lines[-2] if len(lines) > 1 else None
+    return previous, lines[-1]
+
+
+def recover(path=SCORES_FILE):
+    # repairs the end of the file after a crash or power cut: a complete last record gets
+    # its newline, a torn one is cut off. Returns the number of bytes dropped.
+    try:
+        f = open(path, 'rb+')
+    except FileNotFoundError:
+        return 0
+    with f:
+        size = f.seek(0, 2)
+        previous, last_line = read_tail(f, size)
+        if not last_line:
+            return 0
+        if is_complete(last_line, previous):
+            f.write(b'\n')
+            dropped = 0
+        else:
+            f.truncate(size - len(last_line))
+            dropped = len(last_line)
+        f.flush()
+        os.fsync(f.fileno())
+    return dropped
+
+
+def needs_separator(path):
+    # whether the file is empty or ends with a record of an older version; records of this
+    # one end with a checksum (recover() has already run, so the file ends with a newline)
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return True
+    with f:
+        size = f.seek(0, 2)
+        previous, last_line = read_tail(f, size)
+    return not previous or len(split_line(previous)) <= 7
+
+
+# appends scores to scores.csv on a background thread so the game over screen never waits
+# for the disk; every record is one newline-terminated line, a batch goes out in a single
+# write to the end of the file followed by one fsync
+class ScoreWriter(object):
+    def __init__(self, path=SCORES_FILE, repository=SCORES, max_queue=MAX_QUEUE, batch_interval=BATCH_INTERVAL):
+        self.path = path
+        self.repository = repository
+        self.batch_interval = batch_interval
+        self.queue = queue.Queue(max_queue)
+        self.recovered = False
+        self.separate = False
+        self.records_written = 0
+        self.batches = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def recover(self):
+        if not self.recovered:
+            self.recovered = True
+            dropped = recover(self.path)
+            if dropped:
+                print(f'dropped a torn record of {dropped} bytes at the end of {self.path}', file=sys.stderr)
+            self.separate = needs_separator(self.path)
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='score writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, record):
+        self.start()
+        self.queue.put(record)
+
+    def flush(self):
+        # waits until everything submitted so far is on disk
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait()
+
+    def close(self):
+        if self._thread is None:
+            return
+        self.queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        self.recover()
+        pending = []
+        waiting = []
+        stop = False
+        while not stop:
+            # block for the first record, then give the batch a moment to fill up
+            timeout = None if not pending else RETRY_INTERVAL
+            deadline = None
+            while True:
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                if isinstance(item, threading.Event):
+                    # a flush, write what there is right away
+                    waiting.append(item)
+                    break
+                pending.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.batch_interval
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+            if pending:
+                try:
+                    self._write(pending)
+                    pending = []
+                except OSError as e:
+                    # keep the records and try again, unless the game is closing anyway
+                    print(f'could not save scores to {self.path}: {e}', file=sys.stderr)
+            for done in waiting:
+                done.set()
+            waiting = []
+
+    def _write(self, records):
+        data = ''.join(format_line(record) for record in records)
+        if self.separate:
+            # an empty line ahead of the first record tells recover() the file is no longer an old one
+            data = '\n' + data
+        data = data.encode()
+        created = not os.path.exists(self.path)
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            before = os.fstat(fd)
+            written = 0
+            while written < len(data):
+                written += os.write(fd, data[written:])
+            os.fsync(fd)
+            after = os.fstat(fd)
+        finally:
+            os.close(fd)
+        if created:
+            # make the new directory entry durable as well
+            directory = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+        self.separate = False
+        self.records_written += len(records)
+        self.batches += 1
+        if self.repository is not None:
+            # a file that did not exist had no stamp
+            before = None if created else (before.st_mtime_ns, before.st_size)
+            self.repository.written(before, (after.st_mtime_ns, after.st_size))
+
+
+SCORE_WRITER = ScoreWriter()
+atexit.register(SCORE_WRITER.close)
+
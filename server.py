@@ -0,0 +1,244 @@
+import argparse
+import asyncio
+import heapq
+import random
+import time
+from collections import deque
+from game import Game, STEP_TIME, MAX_FRAME_TIME
+from player import Player
+from profiler import percentiles
+from protocol import (FRAME, NEW, INPUT, WATCH, STATS, NEW_GAME, SESSION_ID, encode_state, encode_stats,
+                      state_fields)
+
+DEFAULT_ADDRESS = '127.0.0.1:7777'
+# a subscriber with more unsent bytes than this skips updates and gets a full state once it caught up
+MAX_BUFFER = 1 << 16
+# sessions run between two chances for the connections to read and write
+SESSIONS_PER_YIELD = 64
+
+
+# one game on the server and the connections that follow it; state goes out as deltas,
+# only the rows that changed since the last message and only when something changed
+class GameSession(object):
+    def __init__(self, session_id, seed, speed_level, mode, width, height):
+        self.id = session_id
+        player = Player()
+        player.set_start_speed_level(speed_level)
+        self.game = Game(player, mode, random.Random(seed), width, height)
+        self.inputs = []
+        # writer -> whether it missed updates and needs a full state
+        self.subscribers = {}
+        self.sent_rows = [[None] * width for _ in range(height)]
+        self.sent_top = height
+        self.sent_fields = None
+        self.sent_pieces = 0
+        self.next_tick = None
+
+    def advance(self, now):
+        # inputs that came in since the last run, then every tick that is due
+        game = self.game
+        for action in self.inputs:
+            game.apply_action(action)
+        self.inputs.clear()
+        step = STEP_TIME / 1000
+        if now - self.next_tick > MAX_FRAME_TIME / 1000:
+            # too far behind, skip the ticks like Game.advance drops a long stall
+            self.next_tick = now - MAX_FRAME_TIME / 1000
+        while self.next_tick <= now and not game.lost:
+            game.tick()
+            self.next_tick += step
+
+    def changed_rows(self):
+        # rows above both the old and the new top of the stack are empty in both
+        grid = self.game.grid
+        rows = []
+        for y in range(min(grid.top, self.sent_top), grid.height):
+            if grid.colors[y] != self.sent_rows[y]:
+                self.sent_rows[y] = grid.colors[y][:]
+                rows.append((y, self.sent_rows[y]))
+        self.sent_top = grid.top
+        return rows
+
+    def full_state(self):
+        grid = self.game.grid
+        return encode_state(self.id, self.game, [(y, grid.colors[y]) for y in range(grid.top, grid.height)], True)
+
+    def subscribe(self, writer):
+        writer.write(self.full_state())
+        self.subscribers[writer] = False
+
+    def publish(self):
+        game = self.game
+        fields = state_fields(game) + (game.lost,)
+        # the locked cells only change when a piece locks
+        locked = game.pieces != self.sent_pieces
+        if fields == self.sent_fields and not locked:
+            return
+        self.sent_fields = fields
+        self.sent_pieces = game.pieces
+        delta = encode_state(self.id, game, self.changed_rows() if locked else [])
+        full = None
+        for writer, stale in list(self.subscribers.items()):
+            if writer.is_closing():
+                del self.subscribers[writer]
+            elif writer.transport.get_write_buffer_size() > MAX_BUFFER:
+                self.subscribers[writer] = True
+            elif stale:
+                if full is None:
+                    full = self.full_state()
+                writer.write(full)
+                self.subscribers[writer] = False
+            else:
+                writer.write(delta)
+
+
+# runs many independent games; every session keeps its own tick deadline and a single
+# scheduler runs whichever session is due next, so an idle server sleeps
+class GameServer(object):
+    def __init__(self, batch=1):
+        self.batch = batch
+        self.sessions = {}
+        self.next_id = 1
+        self.heap = []
+        self.ticks = 0
+        # how late each session run started, in seconds
+        self.latencies = deque(maxlen=100000)
+        self.stats_time = time.perf_counter()
+        self.stats_cpu = time.process_time()
+        self.stats_ticks = 0
+
+    def create_session(self, seed, speed_level, mode, width, height):
+        session = GameSession(self.next_id, seed, speed_level, mode, width, height)
+        self.next_id += 1
+        session.next_tick = time.perf_counter() + STEP_TIME / 1000
+        self.sessions[session.id] = session
+        self.schedule(session)
+        return session
+
+    def close_session(self, session):
+        # spectators see the connection close
+        self.sessions.pop(session.id, None)
+        for writer in session.subscribers:
+            writer.close()
+
+    def schedule(self, session):
+        # with a batch of n the session wakes up for every n-th tick and runs n at once
+        deadline = session.next_tick + (self.batch - 1) * STEP_TIME / 1000
+        heapq.heappush(self.heap, (deadline, session.id))
+
+    async def run_scheduler(self):
+        heap = self.heap
+        processed = 0
+        while True:
+            if not heap:
+                await asyncio.sleep(STEP_TIME / 1000)
+                continue
+            now = time.perf_counter()
+            deadline, session_id = heap[0]
+            if deadline > now:
+                await asyncio.sleep(deadline - now)
+                continue
+            heapq.heappop(heap)
+            session = self.sessions.get(session_id)
+            if session is None:
+                continue
+            self.latencies.append(now - deadline)
+            ticks = session.game.ticks
+            session.advance(now)
+            self.ticks += session.game.ticks - ticks
+            session.publish()
+            if not session.game.lost:
+                self.schedule(session)
+            processed += 1
+            if processed % SESSIONS_PER_YIELD == 0:
+                await asyncio.sleep(0)
+
+    def stats(self):
+        # numbers since the previous call
+        now = time.perf_counter()
+        cpu = time.process_time()
+        latencies = sorted(self.latencies)
+        self.latencies.clear()
+        result = {
+            'sessions': len(self.sessions),
+            'active': sum(not session.game.lost for session in self.sessions.values()),
+            'session_ids': sorted(self.sessions)[:100],
+            'seconds': now - self.stats_time,
+            'cpu_seconds': cpu - self.stats_cpu,
+            'ticks': self.ticks - self.stats_ticks,
+            'latency_ms': dict(zip(('p50', 'p95', 'p99'), (value * 1000 for value in percentiles(latencies)))),
+        }
+        result['latency_ms']['max'] = latencies[-1] * 1000 if latencies else 0
+        self.stats_time, self.stats_cpu, self.stats_ticks = now, cpu, self.ticks
+        return result
+
+    async def handle(self, reader, writer):
+        owned = None
+        watched = None
+        try:
+            while True:
+                length, kind = FRAME.unpack(await reader.readexactly(FRAME.size))
+                payload = await reader.readexactly(length)
+                if kind == INPUT:
+                    if owned is not None and payload:
+                        owned.inputs.append(payload[0])
+                elif kind == NEW and owned is None:
+                    owned = self.create_session(*NEW_GAME.unpack(payload))
+                    owned.subscribe(writer)
+                elif kind == WATCH:
+                    session = self.sessions.get(SESSION_ID.unpack(payload)[0])
+                    if session is None:
+                        break
+                    watched = session
+                    session.subscribe(writer)
+                elif kind == STATS:
+                    writer.write(encode_stats(self.stats()))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            # a game ends with the connection of its player
+            if owned is not None:
+                self.close_session(owned)
+            if watched is not None:
+                watched.subscribers.pop(writer, None)
+            writer.close()
+
+
+def parse_address(address):
+    # host:port for TCP, anything with a slash is a unix socket path
+    if '/' in address:
+        return address, None
+    host, port = address.rsplit(':', 1)
+    return host, int(port)
+
+
+async def serve(address=DEFAULT_ADDRESS, batch=1, ready=None):
+    server = GameServer(batch)
+    host, port = parse_address(address)
+    if port is None:
+        listener = await asyncio.start_unix_server(server.handle, host)
+    else:
+        listener = await asyncio.start_server(server.handle, host, port)
+    if ready is not None:
+        ready()
+    async with listener:
+        await asyncio.gather(listener.serve_forever(), server.run_scheduler())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Host many games and stream their state to clients.')
+    parser.add_argument('address', nargs='?', default=DEFAULT_ADDRESS,
+                        help=f'host:port or a unix socket path (default: {DEFAULT_ADDRESS})')
+    parser.add_argument('--batch', type=int, default=1,
+                        help='ticks a session runs per wake-up, more trades latency for throughput (default: 1)')
+    args = parser.parse_args()
+    print(f'listening on {args.address}')
+    try:
+        asyncio.run(serve(args.address, args.batch))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
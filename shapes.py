@@ -0,0 +1,162 @@
+# SHAPE FORMATS
+S = [['.....',
+      '......',
+      '..00..',
+      '.00...',
+      '.....'],
+     ['.....',
+      '..0..',
+      '..00.',
+      '...0.',
+      '.....']]
+
+Z = [['.....',
+      '.....',
+      '.00..',
+      '..00.',
+      '.....'],
+     ['.....',
+      '..0..',
+      '.00..',
+      '.0...',
+      '.....']]
+
+I = [['..0..',
+      '..0..',
+      '..0..',
+      '..0..',
+      '.....'],
+     ['.....',
+      '0000.',
+      '.....',
+      '.....',
+      '.....']]
+
+O = [['.....',
+      '.....',
+      '.00..',
+      '.00..',
+      '.....']]
+
+J = [['.....',
+      '.0...',
+      '.000.',
+      '.....',
+      '.....'],
+     ['.....',
+      '..00.',
+      '..0..',
+      '..0..',
+      '.....'],
+     ['.....',
+      '.....',
+      '.000.',
+      '...0.',
+      '.....'],
+     ['.....',
+      '..0..',
+      '..0..',
+      '.00..',
+      '.....']]
+
+L = [['.....',
+      '...0.',
+      '.000.',
+      '.....',
+      '.....'],
+     ['.....',
+      '..0..',
+      '..0..',
+      '..00.',
+      '.....'],
+     ['.....',
+      '.....',
+      '.000.',
+      '.0...',
+      '.....'],
+     ['.....',
+      '.00..',
+      '..0..',
+      '..0..',
+      '.....']]
+
+T = [['.....',
+      '..0..',
+      '.000.',
+      '.....',
+      '.....'],
+     ['.....',
+      '..0..',
+      '..00.',
+      '..0..',
+      '.....'],
+     ['.....',
+      '.....',
+      '.000.',
+      '..0..',
+      '.....'],
+     ['.....',
+      '..0..',
+      '.00..',
+      '..0..',
+      '.....']]
+
+SHAPES = [S, Z, I, O, J, L, T]
+SHAPE_COLORS = [(0, 255, 0), (255, 0, 0), (0, 255, 255), (255, 255, 0),
+                (255, 165, 0), (0, 0, 255), (128, 0, 128)]
+# a cell as one byte, 0 for empty and the index of the color plus one, for the network and the batch engine
+COLOR_CODES = {color: i + 1 for i, color in enumerate(SHAPE_COLORS)}
+CODE_COLORS = [None] + list(SHAPE_COLORS)
+
+
+def compile_rotation(variety):
+    # cell offsets relative to the piece position, with the -2/-4 template offset applied
+    cells = []
+    for i, row in enumerate(variety):
+        for j, column in enumerate(row):
+            if column == '0':
+                cells.append((j - 2, i - 4))
+    return tuple(cells)
+
+
+def get_bounds(cells):
+    xs = [x for x, y in cells]
+    ys = [y for x, y in cells]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def get_row_masks(cells, bounds):
+    # bit (x - min_x) of masks[y - min_y] is set for every cell of the rotation
+    min_x, min_y, max_x, max_y = bounds
+    masks = [0] * (max_y - min_y + 1)
+    for x, y in cells:
+        masks[y - min_y] |= 1 << (x - min_x)
+    return tuple(masks)
+
+
+def get_column_masks(cells, bounds):
+    # bit (y - min_y) of masks[x - min_x] is set for every cell of the rotation
+    min_x, min_y, max_x, max_y = bounds
+    masks = [0] * (max_x - min_x + 1)
+    for x, y in cells:
+        masks[x - min_x] |= 1 << (y - min_y)
+    return tuple(masks)
+
+
+def get_column_bottoms(cells):
+    # lowest cell of every column the rotation covers, as (x, y) offsets
+    bottoms = {}
+    for x, y in cells:
+        if y > bottoms.get(x, y - 1):
+            bottoms[x] = y
+    return tuple(sorted(bottoms.items()))
+
+
+# compiled once at import, indexed by [shape index][rotation]
+ROTATIONS = tuple(tuple(compile_rotation(variety) for variety in shape) for shape in SHAPES)
+BOUNDS = tuple(tuple(get_bounds(cells) for cells in shape) for shape in ROTATIONS)
+ROW_MASKS = tuple(tuple(get_row_masks(cells, bounds) for cells, bounds in zip(shape, shape_bounds))
+                  for shape, shape_bounds in zip(ROTATIONS, BOUNDS))
+COLUMN_MASKS = tuple(tuple(get_column_masks(cells, bounds) for cells, bounds in zip(shape, shape_bounds))
+                     for shape, shape_bounds in zip(ROTATIONS, BOUNDS))
+COLUMN_BOTTOMS = tuple(tuple(get_column_bottoms(cells) for cells in shape) for shape in ROTATIONS)
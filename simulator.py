@@ -0,0 +1,127 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+from multiprocessing import Pool
+from bot import Bot
+from game import Game, MODES, SURVIVAL, DROP
+from player import Player
+
+SPEED_LEVELS = {'low': 1, 'medium': 30, 'high': 60}
+
+# simulated frame length in milliseconds
+FRAME_TIME = 16
+ACTIONS_PER_FRAME = 0.2
+MAX_TICKS = 500000
+
+
+def random_policy(game, rng):
+    if rng.random() < ACTIONS_PER_FRAME:
+        return [rng.randrange(DROP + 1)]
+    return []
+
+
+def play_game(job):
+    seed, speed_level, mode, max_ticks, policy, width, height, bot_workers = job
+    # pieces and inputs get their own generators so a game only depends on its seed
+    pieces = random.Random(seed)
+    inputs = random.Random(seed ^ 0x5DEECE66D)
+
+    player = Player()
+    player.set_start_speed_level(speed_level)
+    game = Game(player, mode, pieces, width, height)
+
+    if policy == 'bot':
+        bot = Bot(workers=bot_workers, executor='process')
+        while not game.lost and game.ticks < max_ticks:
+            game.update(FRAME_TIME, bot.get_actions(game))
+        bot.close()
+    else:
+        while not game.lost and game.ticks < max_ticks:
+            game.update(FRAME_TIME, random_policy(game, inputs))
+
+    return {
+        'seed': seed,
+        'score': player.score,
+        'lines': game.lines,
+        'pieces': game.pieces,
+        'max_combo': player.max_combo,
+        'speed_level': player.speed_level,
+        'ticks': game.ticks,
+        'timer': player.timer,
+    }
+
+
+def summarize(values):
+    values = sorted(values)
+    if not values:
+        return {}
+    deciles = statistics.quantiles(values, n=10) if len(values) > 1 else [values[0]] * 9
+    return {
+        'min': values[0],
+        'mean': statistics.fmean(values),
+        'p10': deciles[0],
+        'p50': deciles[4],
+        'p90': deciles[8],
+        'max': values[-1],
+    }
+
+
+def run_batch(games, seed=0, speed_level=30, mode=SURVIVAL, workers=None, max_ticks=MAX_TICKS, policy='random',
+              width=10, height=20, bot_workers=0):
+    jobs = [(seed + i, speed_level, mode, max_ticks, policy, width, height, bot_workers) for i in range(games)]
+    workers = workers or os.cpu_count() or 1
+    if bot_workers and workers > 1:
+        # pool workers cannot start processes of their own
+        raise ValueError('bot workers need the games to run in one process (workers=1)')
+    # hand out a few chunks per worker so the pool stays busy without chatty IPC
+    chunksize = max(1, games // (workers * 4))
+
+    start = time.perf_counter()
+    if workers == 1:
+        results = [play_game(job) for job in jobs]
+    else:
+        with Pool(workers) as pool:
+            results = pool.map(play_game, jobs, chunksize)
+    elapsed = time.perf_counter() - start
+
+    summary = {key: summarize([result[key] for result in results])
+               for key in ('score', 'lines', 'max_combo', 'ticks', 'timer')}
+    summary['games'] = games
+    summary['workers'] = workers
+    summary['seconds'] = elapsed
+    summary['ticks_per_second'] = sum(result['ticks'] for result in results) / elapsed if elapsed else 0
+    return summary, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play many headless games and summarize the results.')
+    parser.add_argument('-n', '--games', type=int, default=100)
+    parser.add_argument('-s', '--seed', type=int, default=0, help='seed of the first game, the rest count up from it')
+    parser.add_argument('--speed', choices=SPEED_LEVELS, default='medium')
+    parser.add_argument('--mode', choices=MODES, default='survival')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='number of processes (default: all cores)')
+    parser.add_argument('--max-ticks', type=int, default=MAX_TICKS)
+    parser.add_argument('--policy', choices=['random', 'bot'], default='random', help='who presses the keys')
+    parser.add_argument('--bot-workers', type=int, default=0,
+                        help='processes the bot spreads its look-ahead over, needs -j 1 (default: 0)')
+    parser.add_argument('--games-out', help='write every game result to this JSON file')
+    parser.add_argument('--width', type=int, default=10, help='board width in cells (default: 10)')
+    parser.add_argument('--height', type=int, default=20, help='board height in cells (default: 20)')
+    args = parser.parse_args()
+    if args.bot_workers and args.workers != 1:
+        parser.error('--bot-workers needs -j 1, the games themselves already run in parallel otherwise')
+
+    summary, results = run_batch(args.games, args.seed, SPEED_LEVELS[args.speed], MODES[args.mode],
+                                 args.workers, args.max_ticks, args.policy, args.width, args.height,
+                                 args.bot_workers)
+    if args.games_out:
+        with open(args.games_out, 'w') as f:
+            json.dump(results, f)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()
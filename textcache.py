@@ -0,0 +1,40 @@
+from collections import OrderedDict
+
+
+# bounded LRU cache of rendered text surfaces, most labels are the same from frame to frame
+class TextCache(object):
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, color, antialias=True):
+        key = (font, text, tuple(color), antialias)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+
+        self.misses += 1
+        surface = font.render(text, antialias, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_size:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.surfaces)}
+
+    def clear(self):
+        self.surfaces.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+TEXT_CACHE = TextCache()
+
+
+def render_text(font, text, color, antialias=True):
+    return TEXT_CACHE.render(font, text, color, antialias)
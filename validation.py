@@ -1,22 +1,44 @@
-from grid import BLOCK_COLOR
+from shapes import BOUNDS, ROW_MASKS, COLUMN_BOTTOMS
 
 
-def valid_space(shape, grid, convert_shape_format):
-    free_pos = [[(j, i) for j in range(10) if grid[i][j] == BLOCK_COLOR] for i in range(20)]
-    free_pos = [j for sub in free_pos for j in sub]
+def valid_placement(grid, index, rotation, x, y):
+    # check a candidate placement of shape `index` without building a Piece
+    masks = ROW_MASKS[index]
+    rotation %= len(masks)
+    min_x, min_y, max_x, max_y = BOUNDS[index][rotation]
+    if x + min_x < 0 or x + max_x >= grid.width or y + max_y >= grid.height:
+        return False
 
-    formatted = convert_shape_format(shape)
-
-    for pos in formatted:
-        if pos not in free_pos:
-            if pos[1] > -1:
-                return False
+    shift = x + min_x
+    rows = grid.rows
+    for i, mask in enumerate(masks[rotation], start=y + min_y):
+        if i > -1 and rows[i] & (mask << shift):
+            return False
     return True
 
 
-def check_lost(positions):
-    for pos in positions:
-        x, y = pos
-        if y < 1:
-            return True
-    return False
+def drop_distance(grid, index, rotation, x, y):
+    # how many rows a placement can fall, one lookup per covered column as long as
+    # the piece is above the surface; under an overhang it falls back to stepping down
+    bottoms = COLUMN_BOTTOMS[index]
+    tops = grid.tops
+    distance = None
+    for dx, dy in bottoms[rotation % len(bottoms)]:
+        gap = tops[x + dx] - (y + dy) - 1
+        if gap < 0:
+            distance = 0
+            while valid_placement(grid, index, rotation, x, y + distance + 1):
+                distance += 1
+            return distance
+        if distance is None or gap < distance:
+            distance = gap
+    return distance
+
+
+def valid_space(shape, grid):
+    return valid_placement(grid, shape.index, shape.rotation, shape.x, shape.y)
+
+
+def check_lost(grid):
+    # any locked brick in the top row or above the box ends the game
+    return grid.overflow or grid.rows[0] != 0